@@ -0,0 +1,111 @@
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from bench_resource_blocking import serve
+from fetch_nutrition_data import HttpFetcher, fetch_nutrition_table
+
+# Serves saved-style product pages from a local fixture site: some with the
+# nutrition table in the server-rendered HTML, some that build it with
+# JavaScript. Each page goes through the same HTTP-first / browser-fallback
+# path as the scraper, and the script reports which path each took, how long
+# they took and whether the extracted tables are right.
+
+NUTRITION = {
+    "Ενέργεια": "1569 kJ / 375 kcal",
+    "Λιπαρά": "12,5 g",
+    "εκ των οποίων κορεσμένα": "3,1 g",
+    "Υδατάνθρακες": "55 g",
+    "εκ των οποίων σάκχαρα": "4,2 g",
+    "Πρωτεΐνες": "9,8 g",
+    "Αλάτι": "1,1 g",
+}
+
+ROWS_HTML = "".join(f"<tr><td>{key}</td><td>{value}</td></tr>" for key, value in NUTRITION.items())
+
+STATIC_PAGE = """<!doctype html>
+<html><head><meta charset="utf-8"></head><body>
+<h1>Product {i}</h1>
+<div class="product-detail__section product-detail__section--table">
+  <table><thead><tr><th>Διατροφική αξία</th><th>ανά 100g</th></tr></thead>
+  <tbody>{rows}</tbody></table>
+</div>
+</body></html>
+"""
+
+SCRIPTED_PAGE = """<!doctype html>
+<html><head><meta charset="utf-8"></head><body>
+<h1>Product {i}</h1>
+<div id="details"></div>
+<script>
+  document.getElementById("details").innerHTML =
+    '<div class="product-detail__section product-detail__section--table"><table><tbody>{rows}</tbody></table></div>';
+</script>
+</body></html>
+"""
+
+def build_fixture_site(root, static, scripted):
+    pages = []
+    for i in range(static + scripted):
+        template = STATIC_PAGE if i < static else SCRIPTED_PAGE
+        name = f"product-{i}.html"
+        with open(os.path.join(root, name), "w", encoding="utf-8") as f:
+            f.write(template.format(i=i, rows=ROWS_HTML))
+        pages.append(name)
+    return pages
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compare the HTTP fast path with the browser fallback on fixture pages.")
+    parser.add_argument("--static", type=int, default=40, help="pages with a server-rendered nutrition table")
+    parser.add_argument("--scripted", type=int, default=10, help="pages that build the table with JavaScript")
+    parser.add_argument("--no-browser", dest="browser", action="store_false",
+                        help="only run the HTTP path (scripted pages are then just counted as fallbacks)")
+    return parser.parse_args()
+
+async def main(static=40, scripted=10, browser=True):
+    with tempfile.TemporaryDirectory() as root:
+        pages = build_fixture_site(root, static, scripted)
+        server = serve(root)
+        base = f"http://127.0.0.1:{server.server_address[1]}/"
+        http = HttpFetcher()
+
+        timings = {"http": [], "browser": []}
+        wrong = 0
+        fallbacks = 0
+        if browser:
+            from playwright.async_api import async_playwright
+            async with async_playwright() as p:
+                chromium = await p.chromium.launch(headless=True)
+                page = await chromium.new_page()
+                for i, name in enumerate(pages):
+                    started = time.perf_counter()
+                    nutrition, path = await fetch_nutrition_table(page, {'id': i, 'url': base + name}, http)
+                    timings[path].append(time.perf_counter() - started)
+                    wrong += nutrition != NUTRITION
+                await chromium.close()
+        else:
+            for name in pages:
+                started = time.perf_counter()
+                nutrition = await http.fetch(base + name)
+                if nutrition is None:
+                    fallbacks += 1
+                    continue
+                timings["http"].append(time.perf_counter() - started)
+                wrong += nutrition != NUTRITION
+
+        await http.close()
+        server.shutdown()
+
+    for path, samples in timings.items():
+        if samples:
+            print(f"{path}: {len(samples)} pages, {sum(samples) / len(samples) * 1000:.1f} ms per page")
+    if fallbacks:
+        print(f"{fallbacks} pages would fall back to the browser")
+    extracted = sum(len(samples) for samples in timings.values())
+    print(f"{extracted - wrong} of {extracted} extracted tables match the fixture")
+
+if __name__ == "__main__":
+    args = parse_args()
+    asyncio.run(main(**vars(args)))
@@ -0,0 +1,103 @@
+import argparse
+import asyncio
+import functools
+import http.server
+import os
+import tempfile
+import threading
+
+from playwright.async_api import async_playwright
+
+from scraping import DEFAULT_BLOCKED_PATTERNS, ResourcePolicy, ResourceStats, block_resources
+
+# Loads a generated static fixture site (product cards plus images, fonts,
+# stylesheets and an "ad" script) with and without the resource policy and
+# reports the requests and bytes each run transferred.
+
+PRODUCT_HTML = """
+<div class="product">
+  <figure class="product__figure"><a href="#"><img src="img/{i}.jpg"></a></figure>
+  <h4 class="product__title"><a href="/product-{i}">Product {i}</a></h4>
+  <div class="main-price"><span class="price">{i},99 € /τεμ.</span></div>
+</div>
+"""
+
+PAGE_HTML = """<!doctype html>
+<html><head>
+<link rel="stylesheet" href="css/site.css">
+<script src="ads/tracker.js"></script>
+</head><body>{products}</body></html>
+"""
+
+def build_fixture_site(root, products, image_kb):
+    os.makedirs(os.path.join(root, "img"))
+    os.makedirs(os.path.join(root, "css"))
+    os.makedirs(os.path.join(root, "fonts"))
+    os.makedirs(os.path.join(root, "ads"))
+    for i in range(products):
+        with open(os.path.join(root, "img", f"{i}.jpg"), "wb") as f:
+            f.write(os.urandom(image_kb * 1024))
+    with open(os.path.join(root, "fonts", "site.woff2"), "wb") as f:
+        f.write(os.urandom(60 * 1024))
+    with open(os.path.join(root, "css", "site.css"), "w") as f:
+        f.write("@font-face { font-family: site; src: url(../fonts/site.woff2); }\n"
+                "body { font-family: site; }\n" + "/* padding */\n" * 2000)
+    with open(os.path.join(root, "ads", "tracker.js"), "w") as f:
+        f.write("var tracked = true;\n" + "// padding\n" * 5000)
+    with open(os.path.join(root, "index.html"), "w", encoding="utf-8") as f:
+        f.write(PAGE_HTML.format(products="".join(PRODUCT_HTML.format(i=i) for i in range(products))))
+
+def serve(root):
+    handler = functools.partial(QuietHandler, directory=root)
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+class QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+async def load(browser, url, policy):
+    page = await browser.new_page()
+    if policy:
+        stats = await block_resources(page, policy)
+    else:
+        stats = ResourceStats()
+        page.on("request", lambda request: setattr(stats, "allowed", stats.allowed + 1))
+        page.on("response", stats.record_response)
+    await page.goto(url, wait_until="load")
+    count = await page.evaluate('document.querySelectorAll(".product").length')
+    await page.close()
+    return count, stats
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compare page loads with and without resource blocking.")
+    parser.add_argument("--products", type=int, default=60, help="product cards on the fixture page")
+    parser.add_argument("--image-kb", type=int, default=40, help="size of each product image")
+    return parser.parse_args()
+
+async def main(products=60, image_kb=40):
+    with tempfile.TemporaryDirectory() as root:
+        build_fixture_site(root, products, image_kb)
+        server = serve(root)
+        url = f"http://127.0.0.1:{server.server_address[1]}/index.html"
+        policy = ResourcePolicy(blocked_patterns=DEFAULT_BLOCKED_PATTERNS + (r"/ads/",))
+
+        async with async_playwright() as p:
+            browser = await p.chromium.launch(headless=True)
+            full_count, full = await load(browser, url, None)
+            blocked_count, blocked = await load(browser, url, policy)
+            await browser.close()
+        server.shutdown()
+
+    assert full_count == blocked_count == products
+    saved_requests = full.allowed - blocked.allowed
+    saved_kb = (full.bytes_loaded - blocked.bytes_loaded) / 1024
+    print(f"Unblocked: {full.allowed} requests, {full.bytes_loaded / 1024:.0f} KB")
+    print(f"Blocked:   {blocked.take()}")
+    print(f"Saved {saved_requests} requests and {saved_kb:.0f} KB per page; "
+          f"all {products} products still extracted")
+
+if __name__ == "__main__":
+    args = parse_args()
+    asyncio.run(main(**vars(args)))
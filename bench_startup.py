@@ -0,0 +1,53 @@
+import argparse
+import statistics
+import subprocess
+import sys
+
+# Cold-start benchmark for fetch_nutrition_data.py. Each sample runs in a fresh
+# interpreter so module imports and model loading are measured from scratch.
+
+IMPORT_SNIPPET = """
+import time
+started = time.perf_counter()
+import fetch_nutrition_data
+print(time.perf_counter() - started)
+"""
+
+# Import plus one model lookup, i.e. the cost of the first unseen key
+FIRST_MATCH_SNIPPET = """
+import time
+started = time.perf_counter()
+import fetch_nutrition_data
+fetch_nutrition_data.match_with_model("Ενέργεια")
+print(time.perf_counter() - started)
+"""
+
+def run_samples(snippet, runs):
+    samples = []
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-c", snippet],
+            capture_output=True, text=True, check=True,
+        )
+        samples.append(float(result.stdout.strip().splitlines()[-1]))
+    return samples
+
+def report(label, samples):
+    print(f"{label}: median {statistics.median(samples):.3f}s, "
+          f"min {min(samples):.3f}s, max {max(samples):.3f}s over {len(samples)} runs")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Measure cold-start time of fetch_nutrition_data.py.")
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per measurement")
+    parser.add_argument("--with-model", action="store_true",
+                        help="also time the first model lookup (loads the SentenceTransformer)")
+    return parser.parse_args()
+
+def main(runs=5, with_model=False):
+    report("import fetch_nutrition_data", run_samples(IMPORT_SNIPPET, runs))
+    if with_model:
+        report("import + first model lookup", run_samples(FIRST_MATCH_SNIPPET, runs))
+
+if __name__ == "__main__":
+    args = parse_args()
+    main(**vars(args))
@@ -1,28 +1,32 @@
-import pymysql
-import re
-from pymysql.cursors import DictCursor
-
-# Safe float conversion from string values
-def safe_float(text):
-    if not text:
-        return 0.0
-    num = re.findall(r"[\d.,]+", text.replace("\u202f", ""))
-    if not num:
-        return 0.0
-    s = num[0].replace(",", ".")
-    try:
-        return float(s)
-    except ValueError:
-        return 0.0
-
-# Nutri-score inspired function
-def nutri_score(product):
-    energy = safe_float(product.get('Ενέργεια'))  # in kJ
-    sugar = safe_float(product.get('εκ των οποίων σάκχαρα'))
-    satfat = safe_float(product.get('εκ των οποίων κορεσμένα') or product.get('Κορεσμένα'))
-    salt = safe_float(product.get('Αλάτι')) * 1000  # convert to mg
-    fiber = safe_float(product.get('Εδώδιμες ίνες') or product.get('Φυτικές ίνες'))
-    protein = safe_float(product.get('Πρωτεΐνες'))
+import argparse
+import time
+
+import numpy as np
+
+from db import BATCH_SIZE, QUERY_STATS, BatchWriter, connect, create_watermark_table, get_watermark, set_watermark
+from nutrition_parsing import backfill_numeric, ensure_nutrition_updated_at
+from snapshot import write_snapshot
+
+# Scorer inputs read from product_nutrition_numeric: energy in kJ, the rest in
+# grams per 100g. Saturated fat and fiber have two possible labels.
+SCORE_COLUMNS_SQL = """
+    COALESCE(n.energy_kj, n.energy_kcal * 4.184) AS energy,
+    n.`εκ των οποίων σάκχαρα` AS sugar,
+    COALESCE(n.`εκ των οποίων κορεσμένα`, n.`Κορεσμένα`) AS satfat,
+    n.`Αλάτι` AS salt,
+    COALESCE(n.`Εδώδιμες ίνες`, n.`Φυτικές ίνες`) AS fiber,
+    n.`Πρωτεΐνες` AS protein
+"""
+
+NUTRIENTS = ['energy', 'sugar', 'satfat', 'salt', 'fiber', 'protein']
+
+
+# Watermark name in pipeline_watermarks for the last scoring run
+WATERMARK = 'calculate_scores'
+
+# Score from numeric values: energy in kJ, everything else in grams per 100g
+def score_values(energy, sugar, satfat, salt, fiber, protein):
+    salt = salt * 1000  # convert to mg
 
     # Normalize negative nutrients (capped at 1)
     e_s = min(energy / 3350, 1.0)
@@ -52,54 +56,172 @@ def assign_grade(score):
     else:
         return "E"
 
-def main():
-    connection = pymysql.connect(
-        host='localhost',
-        user='root',
-        password='1234',
-        database='groceryscore',
-        port=3307,
-        charset='utf8mb4',
-        cursorclass=DictCursor
+# Scorer inputs as float arrays, one entry per row; missing values count as 0
+def nutrient_arrays(rows):
+    return {
+        name: np.fromiter(
+            (row[name] if row[name] is not None else 0.0 for row in rows),
+            dtype=np.float64,
+            count=len(rows),
+        )
+        for name in NUTRIENTS
+    }
+
+# Vectorized score_values: same operations in the same order, on whole arrays
+def nutri_score_batch(energy, sugar, satfat, salt, fiber, protein):
+    salt = salt * 1000  # convert to mg
+
+    e_s = np.minimum(energy / 3350, 1.0)
+    su_s = np.minimum(sugar / 45, 1.0)
+    sf_s = np.minimum(satfat / 10, 1.0)
+    salt_s = np.minimum(salt / 900, 1.0)
+
+    fib_s = np.minimum(fiber / 4.7, 1.0)
+    pro_s = np.minimum(protein / 8.0, 1.0)
+
+    neg = (e_s + su_s + sf_s + salt_s) / 4
+    pos = (fib_s + pro_s) / 2
+    score = np.trunc((1 - neg + pos) / 2 * 100)
+    return np.clip(score, 0, 100).astype(np.int64)
+
+def assign_grade_batch(scores):
+    return np.select(
+        [scores >= 80, scores >= 60, scores >= 40, scores >= 20],
+        ["A", "B", "C", "D"],
+        default="E",
     )
 
+def score_rows(rows):
+    scores = nutri_score_batch(**nutrient_arrays(rows))
+    grades = assign_grade_batch(scores)
+    return scores, grades
+
+# Also used by fetch_nutrition_data.py --score, which writes scores on its own
+def create_score_table(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS product_score (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            product_id INT NOT NULL,
+            nutrition_id INT NOT NULL,
+            score INT NOT NULL,
+            grade CHAR(1) NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE KEY (product_id, nutrition_id),
+            FOREIGN KEY (product_id) REFERENCES products(id),
+            FOREIGN KEY (nutrition_id) REFERENCES product_nutrition(product_id)
+        ) CHARACTER SET=utf8mb4;
+    """)
+
+UPSERT_SCORE = """
+    INSERT INTO product_score (product_id, nutrition_id, score, grade)
+    VALUES (%s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE score=VALUES(score), grade=VALUES(grade)
+"""
+
+# Multi-row upserts of `batch_size` rows, in the caller's transaction
+def upsert_scores(connection, product_ids, scores, grades, batch_size=BATCH_SIZE):
+    with BatchWriter(connection, UPSERT_SCORE, batch_size, commit=False) as writer:
+        for pid, score, grade in zip(product_ids, scores, grades):
+            writer.add((int(pid), int(pid), int(score), str(grade)))
+
+# Nutrition rows changed since the watermark, plus any row that was never scored
+def fetch_rows_to_score(cursor, since=None):
+    query = f"""
+        SELECT pn.product_id, {SCORE_COLUMNS_SQL}
+        FROM product_nutrition pn
+        JOIN product_nutrition_numeric n ON n.product_id = pn.product_id
+    """
+    if since is None:
+        cursor.execute(query)
+    else:
+        cursor.execute(query + """
+            LEFT JOIN product_score ps ON ps.product_id = pn.product_id AND ps.nutrition_id = pn.product_id
+            WHERE pn.updated_at >= %s OR ps.product_id IS NULL
+        """, (since,))
+    return cursor.fetchall()
+
+# Score and store the given products right away, e.g. as a scraper writes them.
+# Reads the same parsed values as a batch run, so both give the same scores.
+def score_products(connection, product_ids, batch_size=BATCH_SIZE):
+    if not product_ids:
+        return 0
+    placeholders = ", ".join(["%s"] * len(product_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f"""
+            SELECT pn.product_id, {SCORE_COLUMNS_SQL}
+            FROM product_nutrition pn
+            JOIN product_nutrition_numeric n ON n.product_id = pn.product_id
+            WHERE pn.product_id IN ({placeholders})
+        """, list(product_ids))
+        rows = cursor.fetchall()
+        scores, grades = score_rows(rows)
+        upsert_scores(connection, [row['product_id'] for row in rows], scores, grades, batch_size)
+    connection.commit()
+    return len(rows)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Calculate nutrition scores for new and changed products.")
+    parser.add_argument("--full", action="store_true",
+                        help="rescore every product instead of only rows changed since the last run")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE,
+                        help="rows per multi-row upsert")
+    parser.add_argument("--verify", action="store_true",
+                        help="check the batch results against the per-row score_values")
+    parser.add_argument("--no-snapshot", dest="snapshot", action="store_false",
+                        help="don't refresh the dashboard snapshot afterwards")
+    return parser.parse_args()
+
+def main(full=False, batch_size=BATCH_SIZE, verify=False, snapshot=True):
+    connection = connect()
+
     with connection.cursor() as cursor:
-        # Create score table if not exists
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS product_score (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                product_id INT NOT NULL,
-                nutrition_id INT NOT NULL,
-                score INT NOT NULL,
-                grade CHAR(1) NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE KEY (product_id, nutrition_id),
-                FOREIGN KEY (product_id) REFERENCES products(id),
-                FOREIGN KEY (nutrition_id) REFERENCES product_nutrition(product_id)
-            ) CHARACTER SET=utf8mb4;
-        """)
+        create_score_table(cursor)
+        # Change tracking for incremental runs
+        ensure_nutrition_updated_at(cursor)
+        create_watermark_table(cursor)
         connection.commit()
 
-        # Fetch all nutrition entries
-        cursor.execute("SELECT * FROM product_nutrition")
-        rows = cursor.fetchall()
-        print(f"Fetched {len(rows)} nutrition entries")
+        # Parse raw text of new or changed rows so scoring can read plain floats
+        backfill_numeric(connection)
 
-        for row in rows:
-            pid = row['product_id']
-            score = nutri_score(row)
-            grade = assign_grade(score)
-            print(f"Product {pid}: Score={score}, Grade={grade}")
+        # Taken before reading, so rows written during this run are picked up next time
+        cursor.execute("SELECT NOW() AS now")
+        run_started = cursor.fetchone()['now']
+        since = None if full else get_watermark(cursor, WATERMARK)
 
-            cursor.execute("""
-                INSERT INTO product_score (product_id, nutrition_id, score, grade)
-                VALUES (%s, %s, %s, %s)
-                ON DUPLICATE KEY UPDATE score=%s, grade=%s
-            """, (pid, pid, score, grade, score, grade))
+        rows = fetch_rows_to_score(cursor, since)
+        if since is None:
+            print(f"Fetched all {len(rows)} nutrition entries")
+        else:
+            print(f"Fetched {len(rows)} nutrition entries changed since {since} or never scored")
 
+        started = time.perf_counter()
+        product_ids = [row['product_id'] for row in rows]
+        scores, grades = score_rows(rows)
+        print(f"Scored {len(rows)} products in {time.perf_counter() - started:.2f}s")
+
+        if verify:
+            mismatches = [
+                pid for pid, row, score in zip(product_ids, rows, scores)
+                if score_values(*(row[name] or 0.0 for name in NUTRIENTS)) != score
+            ]
+            if mismatches:
+                raise RuntimeError(f"Batch scores differ from score_values for products {mismatches[:20]}")
+            print("Batch scores match score_values for every product")
+
+        started = time.perf_counter()
+        upsert_scores(connection, product_ids, scores, grades, batch_size)
+        set_watermark(cursor, WATERMARK, run_started)
         connection.commit()
+        print(f"Stored {len(rows)} scores in {time.perf_counter() - started:.2f}s")
     connection.close()
     print("Done calculating and storing nutrition scores.")
 
+    # Publish the new scores to the dashboards
+    if snapshot:
+        write_snapshot()
+
 if __name__ == "__main__":
-    main()
+    args = parse_args()
+    main(**vars(args))
+    print(QUERY_STATS.summary())
@@ -0,0 +1,96 @@
+import argparse
+
+from pymysql.cursors import SSDictCursor
+
+from db import BATCH_SIZE, QUERY_STATS, connect, ensure_column
+
+# One-off compaction of product_prices: collapses each run of consecutive
+# identical prices of a product into its first row, whose last_seen_at becomes
+# the time the last row of the run was captured. This is the history that
+# update_prices.py --capture changes would have written in the first place.
+
+# Yield (row id to keep, last_seen_at for it, row ids to delete) per run of
+# identical prices in a stream ordered by product_id, id
+def find_runs(rows):
+    run = None
+    for row in rows:
+        if run and run['product_id'] == row['product_id'] and run['price'] == row['price']:
+            run['duplicates'].append(row['id'])
+            run['last_seen_at'] = max(run['last_seen_at'], row['last_seen_at'] or row['captured_at'])
+            continue
+        if run:
+            yield run['id'], run['last_seen_at'], run['duplicates']
+        run = {
+            'id': row['id'],
+            'product_id': row['product_id'],
+            'price': row['price'],
+            'last_seen_at': row['last_seen_at'] or row['captured_at'],
+            'duplicates': [],
+        }
+    if run:
+        yield run['id'], run['last_seen_at'], run['duplicates']
+
+def apply_batch(connection, updates, deletes):
+    with connection.cursor() as cursor:
+        if updates:
+            cursor.executemany("UPDATE product_prices SET last_seen_at = %s WHERE id = %s", updates)
+        if deletes:
+            placeholders = ", ".join(["%s"] * len(deletes))
+            cursor.execute(f"DELETE FROM product_prices WHERE id IN ({placeholders})", deletes)
+    connection.commit()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Collapse runs of identical consecutive prices in product_prices.")
+    parser.add_argument("--dry-run", action="store_true", help="only report what would be removed")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="rows deleted per transaction")
+    return parser.parse_args()
+
+def main(dry_run=False, batch_size=BATCH_SIZE):
+    connection = connect()
+    with connection.cursor() as cursor:
+        ensure_column(cursor, 'product_prices', 'last_seen_at', "TIMESTAMP NULL")
+        connection.commit()
+
+    # Stream the history on its own connection while writing on the other
+    stream = connect(SSDictCursor)
+    rows_read = 0
+    removed = 0
+    updates = []
+    deletes = []
+    with stream.cursor() as cursor:
+        cursor.execute("""
+            SELECT id, product_id, price, captured_at, last_seen_at
+            FROM product_prices
+            ORDER BY product_id, id
+        """)
+
+        def counted(rows):
+            nonlocal rows_read
+            for row in rows:
+                rows_read += 1
+                yield row
+
+        for keep_id, last_seen_at, duplicates in find_runs(counted(cursor)):
+            if not duplicates:
+                continue
+            removed += len(duplicates)
+            if dry_run:
+                continue
+            updates.append((last_seen_at, keep_id))
+            deletes.extend(duplicates)
+            if len(deletes) >= batch_size:
+                apply_batch(connection, updates, deletes)
+                updates, deletes = [], []
+    stream.close()
+
+    if not dry_run:
+        apply_batch(connection, updates, deletes)
+    connection.close()
+
+    action = "Would remove" if dry_run else "Removed"
+    print(f"{action} {removed} of {rows_read} price rows ({rows_read - removed} kept)")
+
+if __name__ == "__main__":
+    args = parse_args()
+    main(**vars(args))
+    print(QUERY_STATS.summary())
@@ -0,0 +1,337 @@
+import asyncio
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import pymysql
+from pymysql.cursors import DictCursor
+
+# Database access shared by every script: connection settings, a connection
+# pool, the SQLAlchemy engine for pandas, batched writes and query statistics,
+# plus schema and bookkeeping helpers.
+
+# Connection settings, overridable from the environment
+DB_HOST = os.environ.get("GROCERY_DB_HOST", "localhost")
+DB_PORT = int(os.environ.get("GROCERY_DB_PORT", "3307"))
+DB_USER = os.environ.get("GROCERY_DB_USER", "root")
+DB_PASSWORD = os.environ.get("GROCERY_DB_PASSWORD", "1234")
+DB_NAME = os.environ.get("GROCERY_DB_NAME", "groceryscore")
+# Connections kept open by the pool and the SQLAlchemy engine
+POOL_SIZE = int(os.environ.get("GROCERY_DB_POOL_SIZE", "4"))
+# Default batch size of every script: rows per multi-row statement or per
+# transaction of a backfill
+BATCH_SIZE = int(os.environ.get("GROCERY_DB_BATCH_SIZE", "500"))
+
+DATABASE_URL = (f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+                "?charset=utf8mb4")
+
+# Number and total time of statements sent to the server, per process. A
+# multi-row executemany counts once per statement it is split into.
+class QueryStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.slowest = 0.0
+
+    def record(self, seconds):
+        with self.lock:
+            self.count += 1
+            self.seconds += seconds
+            self.slowest = max(self.slowest, seconds)
+
+    def summary(self):
+        avg = self.seconds / self.count * 1000 if self.count else 0.0
+        return (f"DB: {self.count} queries in {self.seconds:.2f}s "
+                f"(avg {avg:.1f} ms, slowest {self.slowest * 1000:.0f} ms)")
+
+QUERY_STATS = QueryStats()
+
+_instrumented_cursors = {}
+
+# `cursorclass` with execute() timed into QUERY_STATS
+def instrumented(cursorclass):
+    if cursorclass not in _instrumented_cursors:
+        def execute(self, query, args=None):
+            started = time.perf_counter()
+            try:
+                return cursorclass.execute(self, query, args)
+            finally:
+                QUERY_STATS.record(time.perf_counter() - started)
+        _instrumented_cursors[cursorclass] = type(f"Instrumented{cursorclass.__name__}", (cursorclass,),
+                                                  {"execute": execute})
+    return _instrumented_cursors[cursorclass]
+
+def connect(cursorclass=DictCursor, **kwargs):
+    return pymysql.connect(
+        host=DB_HOST,
+        user=DB_USER,
+        password=DB_PASSWORD,
+        database=DB_NAME,
+        port=DB_PORT,
+        charset='utf8mb4',
+        cursorclass=instrumented(cursorclass),
+        **kwargs
+    )
+
+# Reuses up to `size` open connections between short units of work:
+#     with pool.connection() as connection: ...
+# A connection that comes back mid-transaction is rolled back.
+class ConnectionPool:
+    def __init__(self, size=POOL_SIZE, cursorclass=DictCursor):
+        self.size = size
+        self.cursorclass = cursorclass
+        self.idle = queue.LifoQueue()
+        self.slots = threading.BoundedSemaphore(size)
+
+    @contextmanager
+    def connection(self):
+        self.slots.acquire()
+        try:
+            try:
+                connection = self.idle.get_nowait()
+                connection.ping(reconnect=True)
+            except queue.Empty:
+                connection = connect(self.cursorclass)
+            try:
+                yield connection
+            finally:
+                if connection.open:
+                    connection.rollback()
+                    self.idle.put(connection)
+        finally:
+            self.slots.release()
+
+    def close(self):
+        while not self.idle.empty():
+            self.idle.get_nowait().close()
+
+_pool = None
+_engine = None
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        _pool = ConnectionPool()
+    return _pool
+
+# SQLAlchemy engine for pandas, sharing the settings and the query statistics
+def get_engine():
+    global _engine
+    if _engine is None:
+        from sqlalchemy import create_engine, event
+
+        _engine = create_engine(DATABASE_URL, pool_size=POOL_SIZE, pool_pre_ping=True)
+
+        @event.listens_for(_engine, "before_cursor_execute")
+        def before(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+        @event.listens_for(_engine, "after_cursor_execute")
+        def after(conn, cursor, statement, parameters, context, executemany):
+            QUERY_STATS.record(time.perf_counter() - conn.info["query_started"].pop())
+    return _engine
+
+# Buffers rows for one INSERT ... VALUES (...) [ON DUPLICATE KEY UPDATE ...]
+# statement and writes them as multi-row statements once `batch_size` rows are
+# waiting or the oldest has waited `flush_interval` seconds (checked on add).
+# Each flush commits, unless commit=False: then the rows are part of the
+# caller's transaction, which commits (or rolls back) them. Use as a context
+# manager, or call close() to write the rest.
+class BatchWriter:
+    def __init__(self, connection, sql, batch_size=BATCH_SIZE, flush_interval=5.0, commit=True):
+        self.connection = connection
+        self.sql = sql
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.commit = commit
+        self.rows = []
+        self.first_added = None
+        self.written = 0
+
+    def add(self, row):
+        if not self.rows:
+            self.first_added = time.monotonic()
+        self.rows.append(row)
+        if len(self.rows) >= self.batch_size or time.monotonic() - self.first_added >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+        try:
+            with self.connection.cursor() as cursor:
+                cursor.executemany(self.sql, self.rows)
+            if self.commit:
+                self.connection.commit()
+        except Exception:
+            if self.commit:
+                self.connection.rollback()
+            raise
+        self.written += len(self.rows)
+        self.rows = []
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+
+# Runs the blocking DB work of an asyncio scraper on one dedicated thread that
+# owns `connection`, so the event loop never waits on MySQL. Jobs are called
+# as fn(connection, *args) in submission order. At most `max_pending` may be
+# queued: submit() waits for a free slot, so a slow database slows the
+# scrapers down instead of piling up work. Once a writer exists, only its
+# jobs may touch `connection`.
+class BackgroundWriter:
+    def __init__(self, connection, max_pending=16):
+        self.connection = connection
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+        self.slots = asyncio.Semaphore(max_pending)
+        self.errors = []
+
+    async def _start(self, fn, args):
+        await self.slots.acquire()
+        future = asyncio.get_running_loop().run_in_executor(self.executor, fn, self.connection, *args)
+        future.add_done_callback(lambda _: self.slots.release())
+        return future
+
+    # Run a job and wait for its result; other tasks keep running meanwhile
+    async def run(self, fn, *args):
+        return await (await self._start(fn, args))
+
+    # Queue a job without waiting for it. Its failure is raised by close().
+    async def submit(self, fn, *args):
+        future = await self._start(fn, args)
+        future.add_done_callback(self._record_error)
+
+    def _record_error(self, future):
+        if not future.cancelled() and future.exception() is not None:
+            self.errors.append(future.exception())
+
+    # Wait for every queued job, then stop the thread
+    async def close(self):
+        await self.run(lambda connection: None)
+        self.executor.shutdown()
+        if self.errors:
+            raise self.errors[0]
+
+# Schema and bookkeeping helpers
+
+def column_exists(cursor, table, column):
+    cursor.execute("""
+        SELECT 1 FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s
+    """, (table, column))
+    return cursor.fetchone() is not None
+
+def index_exists(cursor, table, index):
+    cursor.execute("""
+        SELECT 1 FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s
+    """, (table, index))
+    return cursor.fetchone() is not None
+
+# Add a column to a table created by an older version of the scripts
+def ensure_column(cursor, table, column, definition):
+    if not column_exists(cursor, table, column):
+        print(f"Adding column {table}.{column}")
+        cursor.execute(f"ALTER TABLE `{table}` ADD COLUMN `{column}` {definition}")
+
+def ensure_index(cursor, table, index, columns):
+    if not index_exists(cursor, table, index):
+        print(f"Adding index {table}.{index}")
+        cursor.execute(f"ALTER TABLE `{table}` ADD INDEX `{index}` ({columns})")
+
+# High-water marks let a stage pick up only the rows changed since its last run
+def create_watermark_table(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS pipeline_watermarks (
+            name VARCHAR(64) PRIMARY KEY,
+            value TIMESTAMP NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        ) CHARACTER SET=utf8mb4;
+    """)
+
+def get_watermark(cursor, name):
+    cursor.execute("SELECT value FROM pipeline_watermarks WHERE name = %s", (name,))
+    row = cursor.fetchone()
+    if not row:
+        return None
+    return row['value'] if isinstance(row, dict) else row[0]
+
+def set_watermark(cursor, name, value):
+    cursor.execute("""
+        INSERT INTO pipeline_watermarks (name, value) VALUES (%s, %s)
+        ON DUPLICATE KEY UPDATE value=VALUES(value)
+    """, (name, value))
+
+# Runs of pipeline.py, the state of each of their stages, and the items
+# (see StageCheckpoint) each stage has finished
+def create_pipeline_tables(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS pipeline_runs (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            status VARCHAR(16) NOT NULL DEFAULT 'running',
+            started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            finished_at TIMESTAMP NULL
+        ) CHARACTER SET=utf8mb4;
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS pipeline_stages (
+            run_id INT NOT NULL,
+            stage VARCHAR(64) NOT NULL,
+            status VARCHAR(16) NOT NULL,
+            seconds DOUBLE NULL,
+            error TEXT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            PRIMARY KEY (run_id, stage),
+            FOREIGN KEY (run_id) REFERENCES pipeline_runs(id) ON DELETE CASCADE
+        ) CHARACTER SET=utf8mb4;
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS pipeline_checkpoints (
+            run_id INT NOT NULL,
+            stage VARCHAR(64) NOT NULL,
+            item VARCHAR(255) NOT NULL,
+            done_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (run_id, stage, item),
+            FOREIGN KEY (run_id) REFERENCES pipeline_runs(id) ON DELETE CASCADE
+        ) CHARACTER SET=utf8mb4;
+    """)
+
+# Items (categories, products, batches) a pipeline stage has finished in one
+# run, so a resumed run can skip them. Stages run concurrently, so every
+# write borrows a connection from `pool`.
+class StageCheckpoint:
+    def __init__(self, pool, run_id, stage):
+        self.pool = pool
+        self.run_id = run_id
+        self.stage = stage
+        with pool.connection() as connection, connection.cursor() as cursor:
+            cursor.execute("""
+                SELECT item FROM pipeline_checkpoints WHERE run_id = %s AND stage = %s
+            """, (run_id, stage))
+            self.done = {row['item'] if isinstance(row, dict) else row[0] for row in cursor.fetchall()}
+
+    def is_done(self, item):
+        return str(item) in self.done
+
+    def mark(self, item):
+        with self.pool.connection() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute("""
+                    INSERT IGNORE INTO pipeline_checkpoints (run_id, stage, item) VALUES (%s, %s, %s)
+                """, (self.run_id, self.stage, str(item)))
+            connection.commit()
+        self.done.add(str(item))
@@ -0,0 +1,247 @@
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import shutil
+import time
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from sqlalchemy import inspect, text
+
+from db import QUERY_STATS, connect, create_watermark_table, ensure_index, get_engine, get_watermark, set_watermark
+
+# Exports the scored catalog and the price history to Parquet, partitioned by
+# category and snapshot date (hive layout: main_category=.../snapshot_date=...),
+# so analytics can read just the columns and partitions they need instead of
+# joining the transactional tables.
+#
+# catalog: a run writes a category's partition only when its content differs
+# from the category's latest exported partition. The current catalog is the
+# latest partition of every category; older ones keep the catalog as of then.
+# price_history: snapshot_date is the capture date. Rows are only ever
+# appended, so only the dates from the last export on are re-read, and a
+# partition is rewritten only when its content changed. last_seen_at changes on
+# every price run, so it is not part of the history; price_latest.parquet holds
+# it next to each product's current price, rewritten whole (one row per product).
+#
+# manifest.json records the content hash of every partition.
+
+# Next to the scripts, so every stage and reader finds it whatever the working directory
+EXPORT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "export")
+CATALOG_DIR = os.path.join(EXPORT_DIR, "catalog")
+PRICE_HISTORY_DIR = os.path.join(EXPORT_DIR, "price_history")
+PRICE_LATEST_FILE = os.path.join(EXPORT_DIR, "price_latest.parquet")
+MANIFEST_FILE = os.path.join(EXPORT_DIR, "manifest.json")
+# Bumped when the columns of the price history change, so it is re-exported whole
+PRICE_HISTORY_LAYOUT = 2
+WATERMARK = 'export_catalog'
+
+# Partition value for products whose url has no category
+NO_CATEGORY = "unknown"
+
+CATALOG_QUERY = """
+SELECT
+    p.id AS product_id,
+    p.name,
+    p.price,
+    p.price_cents,
+    p.price_unit,
+    p.url,
+    p.image_url,
+    COALESCE(NULLIF(p.main_category, ''), :no_category) AS main_category,
+    p.weight_g,
+    ps.score,
+    ps.grade,
+    nn.energy_kj,
+    nn.energy_kcal,
+    nn.`Λιπαρά` AS fat_g,
+    COALESCE(nn.`εκ των οποίων κορεσμένα`, nn.`Κορεσμένα`) AS satfat_g,
+    nn.`Υδατάνθρακες` AS carbs_g,
+    nn.`εκ των οποίων σάκχαρα` AS sugars_g,
+    COALESCE(nn.`Εδώδιμες ίνες`, nn.`Φυτικές ίνες`) AS fiber_g,
+    nn.`Πρωτεΐνες` AS protein_g,
+    nn.`Αλάτι` AS salt_g
+FROM product_score ps
+JOIN products p ON ps.product_id = p.id
+LEFT JOIN product_nutrition_numeric nn ON ps.nutrition_id = nn.product_id
+ORDER BY p.id
+"""
+
+PRICE_HISTORY_QUERY = """
+SELECT
+    pp.id,
+    pp.product_id,
+    pp.price,
+    pp.price_cents,
+    pp.price_unit,
+    pp.captured_at,
+    COALESCE(NULLIF(p.main_category, ''), :no_category) AS main_category,
+    DATE(pp.captured_at) AS snapshot_date
+FROM product_prices pp
+JOIN products p ON p.id = pp.product_id
+{where}
+ORDER BY pp.id
+"""
+
+PRICE_LATEST_QUERY = """
+SELECT
+    l.product_id,
+    l.price,
+    l.price_cents,
+    l.price_unit,
+    l.previous_price,
+    l.previous_price_cents,
+    l.pct_change,
+    l.changed_at,
+    COALESCE(pp.last_seen_at, pp.captured_at) AS last_seen_at
+FROM product_latest_price l
+JOIN (
+    SELECT product_id, MAX(id) AS id FROM product_prices GROUP BY product_id
+) latest ON latest.product_id = l.product_id
+JOIN product_prices pp ON pp.id = latest.id
+ORDER BY l.product_id
+"""
+
+def load_manifest():
+    if not os.path.exists(MANIFEST_FILE):
+        return {"catalog": {}, "price_history": {}, "price_history_layout": PRICE_HISTORY_LAYOUT}
+    with open(MANIFEST_FILE, encoding="utf-8") as f:
+        return json.load(f)
+
+def save_manifest(manifest):
+    with open(MANIFEST_FILE + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1, ensure_ascii=False, sort_keys=True)
+    os.replace(MANIFEST_FILE + ".tmp", MANIFEST_FILE)
+
+def content_hash(df):
+    digest = hashlib.sha256(",".join(df.columns).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+    return digest.hexdigest()
+
+def partition_dir(root, category, snapshot_date):
+    return os.path.join(root, f"main_category={category}", f"snapshot_date={snapshot_date}")
+
+# Replace one partition directory with a single Parquet file
+def write_partition(root, category, snapshot_date, df):
+    path = partition_dir(root, category, snapshot_date)
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path)
+    pq.write_table(pa.Table.from_pandas(df, preserve_index=False), os.path.join(path, "part-0.parquet"))
+
+# Catalog partitions of today for every category whose content changed
+def export_catalog(engine, manifest, today):
+    with engine.connect() as conn:
+        catalog = pd.read_sql(text(CATALOG_QUERY), conn, params={"no_category": NO_CATEGORY})
+
+    written = 0
+    for category, df in catalog.groupby('main_category', sort=True):
+        df = df.drop(columns='main_category').reset_index(drop=True)
+        digest = content_hash(df)
+        latest = manifest["catalog"].get(category)
+        if latest and latest["hash"] == digest:
+            continue
+        write_partition(CATALOG_DIR, category, today, df)
+        manifest["catalog"][category] = {"snapshot_date": today, "hash": digest}
+        written += 1
+    print(f"Catalog: {len(catalog)} products in {catalog['main_category'].nunique()} categories, "
+          f"{written} partitions written")
+
+# Price history partitions of the capture dates from `since` on
+def export_price_history(engine, manifest, since):
+    with engine.connect() as conn:
+        if since is None:
+            history = pd.read_sql(text(PRICE_HISTORY_QUERY.format(where="")), conn,
+                                  params={"no_category": NO_CATEGORY})
+        else:
+            # Whole days, so a partially exported date is re-read completely
+            history = pd.read_sql(text(PRICE_HISTORY_QUERY.format(where="WHERE pp.captured_at >= :since")), conn,
+                                  params={"no_category": NO_CATEGORY, "since": since.date()})
+
+    written = 0
+    for (category, snapshot_date), df in history.groupby(['main_category', 'snapshot_date'], sort=True):
+        df = df.drop(columns=['main_category', 'snapshot_date']).reset_index(drop=True)
+        key = f"{category}/{snapshot_date}"
+        digest = content_hash(df)
+        if manifest["price_history"].get(key) == digest:
+            continue
+        write_partition(PRICE_HISTORY_DIR, category, snapshot_date, df)
+        manifest["price_history"][key] = digest
+        written += 1
+    print(f"Price history: {len(history)} rows re-read, {written} partitions written")
+
+# Current price and last-seen time of every product, when it changed
+def export_price_latest(engine, manifest):
+    if not inspect(engine).has_table("product_latest_price"):
+        return
+    with engine.connect() as conn:
+        latest = pd.read_sql(text(PRICE_LATEST_QUERY), conn)
+    digest = content_hash(latest)
+    if manifest.get("price_latest") == digest:
+        return
+    pq.write_table(pa.Table.from_pandas(latest, preserve_index=False), PRICE_LATEST_FILE + ".tmp")
+    os.replace(PRICE_LATEST_FILE + ".tmp", PRICE_LATEST_FILE)
+    manifest["price_latest"] = digest
+    print(f"Latest prices: {len(latest)} products written")
+
+# Latest exported catalog partition of every category, reading only `columns`
+def load_catalog(columns=None, filter=None):
+    manifest = load_manifest()
+    if not manifest["catalog"]:
+        return None
+    current = None
+    for category, latest in manifest["catalog"].items():
+        match = (ds.field("main_category") == category) & (ds.field("snapshot_date") == latest["snapshot_date"])
+        current = match if current is None else current | match
+    if filter is not None:
+        current = current & filter
+    dataset = ds.dataset(CATALOG_DIR, format="parquet", partitioning="hive")
+    return dataset.to_table(columns=columns, filter=current).to_pandas()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Export the scored catalog and price history to partitioned Parquet.")
+    parser.add_argument("--full", action="store_true",
+                        help="re-read the whole price history instead of the dates changed since the last export")
+    return parser.parse_args()
+
+def main(full=False):
+    started = time.perf_counter()
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    manifest = load_manifest()
+    engine = get_engine()
+    connection = connect()
+
+    with connection.cursor() as cursor:
+        create_watermark_table(cursor)
+        # Lets the price history be re-read from a capture date on
+        ensure_index(cursor, 'product_prices', 'idx_captured_at', '`captured_at`')
+        connection.commit()
+        # Taken before reading, so rows written during this run are picked up next time
+        cursor.execute("SELECT NOW() AS now")
+        run_started = cursor.fetchone()['now']
+        since = None if full else get_watermark(cursor, WATERMARK)
+
+    if manifest.get("price_history_layout") != PRICE_HISTORY_LAYOUT:
+        print("Price history columns changed, exporting it whole")
+        manifest["price_history"] = {}
+        manifest["price_history_layout"] = PRICE_HISTORY_LAYOUT
+        since = None
+
+    export_catalog(engine, manifest, datetime.date.today().isoformat())
+    export_price_history(engine, manifest, since)
+    export_price_latest(engine, manifest)
+    save_manifest(manifest)
+
+    with connection.cursor() as cursor:
+        set_watermark(cursor, WATERMARK, run_started)
+    connection.commit()
+    connection.close()
+    print(f"Exported to {EXPORT_DIR}/ in {time.perf_counter() - started:.2f}s")
+
+if __name__ == "__main__":
+    args = parse_args()
+    main(**vars(args))
+    print(QUERY_STATS.summary())
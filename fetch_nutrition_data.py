@@ -1,59 +1,151 @@
+import argparse
 import asyncio
+import glob
+import hashlib
+import json
+import os
+import time
+from collections import Counter
+
+import httpx
+import lxml.etree
+import lxml.html
+import numpy as np
 import pymysql
-from pymysql.cursors import DictCursor
-from sentence_transformers import SentenceTransformer, util
+from pymysql.cursors import SSDictCursor
 from playwright.async_api import async_playwright
 
-CANONICAL_KEYS = [
-    "Εδώδιμες ίνες",
-    "Πρωτεΐνες",
-    "Βιταμίνη D2",
-    "Υδατάνθρακες",
-    "Φολικό οξύ (Δ.Τ.Α.)*",
-    "ω-3 λιπαρά οξέα (α-λινολενικό οξύ)",
-    "Βιταμίνη Β6 (Δ.Τ.Α.)*",
-    "Πολυακόρεστα",
-    "Βιταμίνη E (Δ.Τ.Α.)**",
-    "Μονοακόρεστα",
-    "Κορεσμένα",
-    "Ω-3 (EPA, DHA)**",
-    "εκ των οποίων σάκχαρα",
-    "Ενέργεια",
-    "Βιταμίνες",
-    "Βιταμίνη C (Π.Π.Α.)*",
-    "εκ των οποίων κορεσμένα",
-    "ω-6 λιπαρά οξέα (α-λινελαϊκό οξύ)",
-    "Ριβοφλαβίνη (B2)",
-    "Νιασίνη (Δ.Τ.Α.)*",
-    "Φυτικές ίνες",
-    "Αλάτι",
-    "Βιταμίνη Α (Δ.Τ.Α.)**",
-    "Ασβέστιο",
-    "Λιπαρά εκ των οποίων",
-    "Ανόργανα συστατικά",
-    "εκ των οποίων πολυόλες",
-    "Βιταμίνη Β12",
-    "Λιπαρά",
-    "Βιταμίνη D (Δ.Τ.Α.)**",
-    "Ασβέστιο (Δ.Τ.Α.)*",
-    "Βιταμίνη Β2 (Δ.Τ.Α.)*",
-    "Σίδηρος (Δ.Τ.Α.)*"
-]
-
-model = SentenceTransformer('paraphrase-multilingual-MiniLM-L12-v2')
-canonical_embeddings = model.encode(CANONICAL_KEYS, convert_to_tensor=True)
-
-def normalize_key(input_key, threshold=0.75):
-    input_emb = model.encode(input_key, convert_to_tensor=True)
-    cos_scores = util.cos_sim(input_emb, canonical_embeddings)[0]
-    max_score, idx = cos_scores.max(0)
-    if max_score >= threshold:
-        normalized = CANONICAL_KEYS[idx]
-        print(f"Normalized '{input_key}' to '{normalized}' with score {max_score:.3f}")
-        return normalized
-    else:
-        print(f"No good match for '{input_key}' (max score {max_score:.3f})")
-        return None
+from db import QUERY_STATS, BackgroundWriter, BatchWriter, connect, ensure_column
+from nutrition_keys import CANONICAL_KEYS
+from nutrition_parsing import create_numeric_tables, ensure_nutrition_updated_at, parse_and_store
+from scraping import RateLimiter, WorkerStats, block_resources
+from text_forms import lexical_form
+
+MODEL_NAME = 'paraphrase-multilingual-MiniLM-L12-v2'
+EMBEDDINGS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache')
+# Raw nutrition tables as extracted from product pages, one JSON file per product
+RAW_CACHE_DIR = os.path.join(EMBEDDINGS_DIR, 'raw_nutrition')
+
+# Both are loaded on first use, so runs where every key is already known
+# never import sentence_transformers at all
+_model = None
+_canonical_embeddings = None
+
+def get_model():
+    global _model
+    if _model is None:
+        from sentence_transformers import SentenceTransformer
+        print(f"Loading model {MODEL_NAME}...")
+        _model = SentenceTransformer(MODEL_NAME)
+    return _model
+
+# The file name changes whenever the model or the canonical key list does
+def embeddings_path():
+    fingerprint = "\n".join([MODEL_NAME] + CANONICAL_KEYS).encode("utf-8")
+    digest = hashlib.sha256(fingerprint).hexdigest()[:16]
+    return os.path.join(EMBEDDINGS_DIR, f"canonical_embeddings-{digest}.npy")
+
+# Normalized canonical embeddings, computed once and memory-mapped afterwards
+def get_canonical_embeddings():
+    global _canonical_embeddings
+    if _canonical_embeddings is None:
+        path = embeddings_path()
+        if not os.path.exists(path):
+            print("Precomputing canonical key embeddings...")
+            embeddings = get_model().encode(CANONICAL_KEYS, convert_to_numpy=True, normalize_embeddings=True)
+            os.makedirs(EMBEDDINGS_DIR, exist_ok=True)
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                np.save(f, embeddings.astype(np.float32))
+            os.replace(tmp_path, path)
+        _canonical_embeddings = np.load(path, mmap_mode="r")
+    return _canonical_embeddings
+
+# Closest canonical key by cosine similarity -> (key, score)
+def match_with_model(input_key):
+    input_emb = get_model().encode(input_key, convert_to_numpy=True, normalize_embeddings=True)
+    cos_scores = get_canonical_embeddings() @ input_emb
+    idx = int(np.argmax(cos_scores))
+    return CANONICAL_KEYS[idx], float(cos_scores[idx])
+
+LEXICAL_KEYS = {lexical_form(key): key for key in CANONICAL_KEYS}
+
+# Longest raw key stored in nutrition_key_map
+MAX_CACHED_KEY_LENGTH = 255
+
+# Maps raw nutrition labels to canonical keys. Labels that match a canonical key
+# up to accents, case and whitespace never reach the model; everything else is
+# looked up in the persistent nutrition_key_map table, and the model only runs
+# for labels that were never seen before.
+class KeyNormalizer:
+    def __init__(self, connection, threshold=0.75):
+        self.connection = connection
+        self.threshold = threshold
+        self.cache = {}
+        self.lexical_hits = 0
+        self.cache_hits = 0
+        self.misses = 0
+
+    def create_table(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS nutrition_key_map (
+                    raw_key VARCHAR(255) CHARACTER SET utf8mb4 COLLATE utf8mb4_bin PRIMARY KEY,
+                    canonical_key VARCHAR(255) CHARACTER SET utf8mb4 NOT NULL,
+                    score FLOAT NOT NULL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                ) CHARACTER SET=utf8mb4;
+            """)
+        self.connection.commit()
+
+    def load(self):
+        self.create_table()
+        with self.connection.cursor() as cursor:
+            cursor.execute("SELECT raw_key, canonical_key, score FROM nutrition_key_map")
+            for row in cursor.fetchall():
+                self.cache[row['raw_key']] = (row['canonical_key'], row['score'])
+        print(f"Loaded {len(self.cache)} cached nutrition key mappings")
+
+    def remember(self, raw_key, canonical_key, score):
+        self.cache[raw_key] = (canonical_key, score)
+        if len(raw_key) > MAX_CACHED_KEY_LENGTH:
+            return
+        with self.connection.cursor() as cursor:
+            cursor.execute("""
+                INSERT INTO nutrition_key_map (raw_key, canonical_key, score)
+                VALUES (%s, %s, %s)
+                ON DUPLICATE KEY UPDATE canonical_key=VALUES(canonical_key), score=VALUES(score)
+            """, (raw_key, canonical_key, score))
+        self.connection.commit()
+
+    def normalize(self, raw_key):
+        lexical = LEXICAL_KEYS.get(lexical_form(raw_key))
+        if lexical:
+            self.lexical_hits += 1
+            return lexical
+
+        if raw_key in self.cache:
+            self.cache_hits += 1
+            canonical_key, score = self.cache[raw_key]
+        else:
+            self.misses += 1
+            # The best match is cached even below the threshold, so unmappable
+            # labels don't hit the model again either
+            canonical_key, score = match_with_model(raw_key)
+            self.remember(raw_key, canonical_key, score)
+            print(f"Matched new key '{raw_key}' to '{canonical_key}' with score {score:.3f}")
+
+        return canonical_key if score >= self.threshold else None
+
+    def report(self):
+        print(f"Key normalization: {self.lexical_hits} exact matches, "
+              f"{self.cache_hits} cache hits, {self.misses} model lookups")
+
+# Cell text with all whitespace runs (innerText keeps line breaks, lxml
+# doesn't) collapsed to single spaces, so a table gets the same keys and the
+# same content hash whichever path fetched it
+def clean_cell(text):
+    return " ".join(text.split())
 
 async def extract_nutrition_from_page(page):
     nutrition = await page.evaluate('''() => {
@@ -72,23 +164,386 @@ async def extract_nutrition_from_page(page):
         return nutrition;
     }''')
     if nutrition:
+        nutrition = {clean_cell(key): clean_cell(value) for key, value in nutrition.items()}
         print(f"Extracted nutrition data: {nutrition}")
     else:
         print("No nutrition table found on page.")
     return nutrition
 
-async def main():
-    print("Connecting to database...")
-    connection = pymysql.connect(
-        host='localhost',
-        user='root',
-        password='1234',
-        database='groceryscore',
-        port=3307,
-        charset='utf8mb4',
-        cursorclass=DictCursor
-    )
+# Same extraction as extract_nutrition_from_page, on server-rendered HTML.
+# None when the HTML can't be parsed or has no nutrition rows (yet: a page may
+# ship the table wrapper and fill it in with JavaScript).
+def extract_nutrition_from_html(html):
+    try:
+        tree = lxml.html.fromstring(html)
+    except (lxml.etree.ParserError, ValueError):
+        return None
+    tables = tree.xpath(
+        "//*[contains(concat(' ', normalize-space(@class), ' '), ' product-detail__section--table ')]//table")
+    if not tables:
+        return None
+    nutrition = {}
+    # lxml doesn't add the tbody a browser would, so take every row with cells
+    for row in tables[0].iter("tr"):
+        cells = row.findall("td")
+        if len(cells) >= 2:
+            nutrition[clean_cell(cells[0].text_content())] = clean_cell(cells[1].text_content())
+    return nutrition or None
+
+# Fast path: fetch the page over a pooled HTTP client and parse it without a
+# browser. Returns None whenever the browser is needed instead: an HTTP error,
+# an unparseable body, or no table rows in the HTML because the page builds
+# them with JavaScript.
+class HttpFetcher:
+    def __init__(self, max_connections=8):
+        self.client = httpx.AsyncClient(
+            headers={"User-Agent": "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko)"},
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=30.0,
+            follow_redirects=True,
+        )
+
+    async def fetch(self, url):
+        try:
+            response = await self.client.get(url)
+            response.raise_for_status()
+        except httpx.HTTPError as e:
+            print(f"HTTP fetch failed ({e}), using the browser")
+            return None
+        nutrition = extract_nutrition_from_html(response.text)
+        if nutrition is None:
+            print("No nutrition table rows in the HTML, using the browser")
+        return nutrition
+
+    async def close(self):
+        await self.client.aclose()
+
+# Extract a product's nutrition table over HTTP if possible, else in the
+# browser -> (table or None, "http" or "browser")
+async def fetch_nutrition_table(page, prod, http=None, limiter=None):
+    if http:
+        nutrition = await http.fetch(prod['url'])
+        if nutrition is not None:
+            print(f"Extracted nutrition data: {nutrition}")
+            return nutrition, "http"
+        if limiter:
+            await limiter.acquire(prod['url'])
+    await page.goto(prod['url'], timeout=60000)
+    return await extract_nutrition_from_page(page), "browser"
+
+def normalize_nutrition(nutrition_raw, normalizer):
+    nutrition_norm = {}
+    for raw_key, val in nutrition_raw.items():
+        norm_key = normalizer.normalize(raw_key)
+        if norm_key:
+            nutrition_norm[norm_key] = val
+        else:
+            print(f"Warning: Unmapped nutrition key: '{raw_key}'")
+    return nutrition_norm
+
+# Fingerprint of an extracted table, to tell whether a page changed since last time
+def content_hash(nutrition_raw):
+    return hashlib.sha256(json.dumps(nutrition_raw or {}, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+
+def raw_cache_path(product_id):
+    return os.path.join(RAW_CACHE_DIR, f"{product_id}.json")
+
+def save_raw(prod, nutrition_raw, digest):
+    os.makedirs(RAW_CACHE_DIR, exist_ok=True)
+    path = raw_cache_path(prod['id'])
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({"product_id": prod['id'], "url": prod['url'], "fetched_at": time.time(),
+                   "hash": digest, "raw": nutrition_raw}, f, ensure_ascii=False)
+    os.replace(path + ".tmp", path)
+
+# Write a product's normalized nutrition (raw text and parsed values) together
+# with its fetch record, in one transaction. Replays pass digest=None and
+# leave the fetch record alone.
+def store_nutrition(connection, product_id, nutrition_norm, found_table, digest=None):
+    parse_errors = []
+    # The connection is shared by every write, so a failure must not leave half
+    # of this product for the next commit
+    try:
+        with connection.cursor() as cursor:
+            if nutrition_norm:
+                cols = ", ".join(f"`{k}`" for k in nutrition_norm.keys())
+                placeholders = ", ".join(["%s"] * len(nutrition_norm))
+                sql = f"""
+                    INSERT INTO product_nutrition (product_id, {cols})
+                    VALUES (%s, {placeholders})
+                    ON DUPLICATE KEY UPDATE
+                    {', '.join(f"`{k}`=VALUES(`{k}`)" for k in nutrition_norm.keys())}
+                """
+                values = [product_id] + list(nutrition_norm.values())
+                cursor.execute(sql, values)
+                _, parse_errors = parse_and_store(cursor, product_id, nutrition_norm)
+            if digest is not None:
+                record_fetch(cursor, product_id, found_table, digest)
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+
+    for key, raw_val, reason in parse_errors:
+        print(f"Warning: Could not parse '{key}' value '{raw_val}': {reason}")
+    if nutrition_norm:
+        print(f"Inserted/Updated nutrition data for product ID {product_id}")
+    elif found_table:
+        print("No normalized nutrition data to insert.")
 
+# Writer-thread job: normalize a fetched table (the normalizer reads and
+# writes its key mapping on this connection) and store it
+def normalize_and_store(connection, product_id, nutrition_raw, digest, normalizer):
+    nutrition_norm = normalize_nutrition(nutrition_raw or {}, normalizer)
+    store_nutrition(connection, product_id, nutrition_norm, bool(nutrition_raw), digest)
+    return nutrition_norm
+
+# Load one product page (over HTTP when `http` is given, else or as fallback
+# in the browser; `paths` counts which), normalize its nutrition table and
+# store it. All DB work goes through `writer`, off the event loop. A table
+# identical to the last fetch (same content hash) only bumps fetched_at,
+# queued on `fetches` (a BatchWriter of RECORD_FETCH rows) without waiting.
+# With a score_queue, products that got new nutrition data are queued for
+# scoring. Returns False when the page could not be scraped.
+async def scrape_product(page, prod, writer, fetches, normalizer, score_queue=None, http=None, limiter=None,
+                         paths=None):
+    print(f"\nScraping nutrition for product ID {prod['id']} from {prod['url']}")
+    try:
+        nutrition_raw, path = await fetch_nutrition_table(page, prod, http, limiter)
+        if paths is not None:
+            paths[path] += 1
+        digest = content_hash(nutrition_raw)
+        if not os.path.exists(raw_cache_path(prod['id'])) or digest != prod.get('content_hash'):
+            save_raw(prod, nutrition_raw, digest)
+        if digest == prod.get('content_hash'):
+            print("Nutrition table unchanged since last fetch, skipping.")
+            row = (prod['id'], bool(nutrition_raw), digest)
+            await writer.submit(lambda connection: fetches.add(row))
+            return True
+        if not nutrition_raw:
+            print("No nutrition data found, skipping.")
+        nutrition_norm = await writer.run(normalize_and_store, prod['id'], nutrition_raw, digest, normalizer)
+        if score_queue is not None and nutrition_norm:
+            await score_queue.put(prod['id'])
+        return True
+
+    except Exception as e:
+        print(f"Error scraping product {prod['id']}: {e}")
+        return False
+
+def create_fetch_table(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS nutrition_fetches (
+            product_id INT PRIMARY KEY,
+            fetched_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            found_table BOOLEAN NOT NULL,
+            content_hash CHAR(64) NULL,
+            FOREIGN KEY (product_id) REFERENCES products(id) ON DELETE CASCADE
+        ) CHARACTER SET=utf8mb4;
+    """)
+    # Hash of the extracted table, for tables created before it existed
+    ensure_column(cursor, 'nutrition_fetches', 'content_hash', "CHAR(64) NULL")
+
+RECORD_FETCH = """
+    INSERT INTO nutrition_fetches (product_id, found_table, content_hash) VALUES (%s, %s, %s)
+    ON DUPLICATE KEY UPDATE fetched_at=CURRENT_TIMESTAMP, found_table=VALUES(found_table),
+                            content_hash=VALUES(content_hash)
+"""
+
+# Remember when a product page was last loaded, whether or not it had a table,
+# and the hash of what was extracted
+def record_fetch(cursor, product_id, found_table, digest):
+    cursor.execute(RECORD_FETCH, (product_id, found_table, digest))
+
+# Products that were never fetched, or (with max_age_days) whose last fetch is
+# older than that. Rows scraped before nutrition_fetches existed fall back to
+# product_nutrition.updated_at. Ordered by URL so each category's products,
+# which share a URL prefix, are scraped together.
+def worklist_query(max_age_days=None):
+    last_fetch = "COALESCE(f.fetched_at, pn.updated_at)"
+    where = f"{last_fetch} IS NULL"
+    params = ()
+    if max_age_days is not None:
+        where += f" OR {last_fetch} < NOW() - INTERVAL %s DAY"
+        params = (max_age_days,)
+    query = f"""
+        SELECT p.id, p.url, f.content_hash
+        FROM products p
+        LEFT JOIN product_nutrition pn ON pn.product_id = p.id
+        LEFT JOIN nutrition_fetches f ON f.product_id = p.id
+        WHERE {where}
+        ORDER BY p.url
+    """
+    return query, params
+
+# Stream the worklist into the queue over a server-side cursor, then put one
+# stop marker per worker. Rows are read only as fast as workers consume them,
+# in chunks fetched on a worker thread so the event loop never waits on MySQL.
+async def produce_products(queue, workers, max_age_days=None, chunk_size=100):
+    stream = await asyncio.to_thread(connect, SSDictCursor)
+    queued = 0
+    try:
+        with stream.cursor() as cursor:
+            # The server waits on us while the queue is full; don't let it give up
+            await asyncio.to_thread(cursor.execute, "SET SESSION net_write_timeout = 3600")
+            await asyncio.to_thread(cursor.execute, *worklist_query(max_age_days))
+            while rows := await asyncio.to_thread(cursor.fetchmany, chunk_size):
+                for prod in rows:
+                    await queue.put(prod)
+                    queued += 1
+    finally:
+        stream.close()
+        print(f"Queued {queued} products needing nutrition data")
+        for _ in range(workers):
+            await queue.put(None)
+
+async def scrape_worker(name, context, queue, limiter, writer, fetches, normalizer, block=True, score_queue=None,
+                        http=None):
+    resource_stats = await block_resources(context) if block else None
+    page = await context.new_page()
+    stats = WorkerStats(name)
+    paths = Counter()
+    while True:
+        prod = await queue.get()
+        if prod is None:
+            break
+        await limiter.acquire(prod['url'])
+        browser_loads = paths["browser"]
+        stats.record(await scrape_product(page, prod, writer, fetches, normalizer, score_queue, http, limiter,
+                                           paths))
+        # Only a product that went through the browser has requests to report
+        if resource_stats and paths["browser"] > browser_loads:
+            print(f"{name}: {resource_stats.take()}")
+        if (stats.done + stats.failed) % 25 == 0:
+            print(f"{stats.summary()}, {paths['http']} over HTTP, {paths['browser']} in the browser")
+    await page.close()
+    return stats, paths
+
+# Writer-thread job: normalize and store one cached raw table -> its product
+# id, or None when nothing was stored
+def replay_cached(connection, path, normalizer):
+    with open(path, encoding="utf-8") as f:
+        cached = json.load(f)
+    nutrition_norm = normalize_nutrition(cached['raw'] or {}, normalizer)
+    if not nutrition_norm:
+        return None
+    try:
+        store_nutrition(connection, cached['product_id'], nutrition_norm, True)
+    except pymysql.err.IntegrityError as e:
+        # The product was deleted since it was cached
+        print(f"Skipping cached product {cached['product_id']}: {e}")
+        return None
+    return cached['product_id']
+
+# Offline mode: run every cached raw table through normalization and storage
+# again, without a browser, e.g. after changing the key mapping or the parser.
+# Fetch records are left as they are. Each table is stored on the writer
+# thread, so the scoring consumer keeps up meanwhile.
+async def replay_raw_cache(writer, normalizer, score_queue=None):
+    paths = sorted(glob.glob(os.path.join(RAW_CACHE_DIR, "*.json")))
+    print(f"Replaying {len(paths)} cached nutrition tables")
+    stored = 0
+    for i, path in enumerate(paths, start=1):
+        product_id = await writer.run(replay_cached, path, normalizer)
+        if product_id is not None:
+            stored += 1
+            if score_queue is not None:
+                await score_queue.put(product_id)
+        if i % 500 == 0:
+            print(f"Replayed {i}/{len(paths)}")
+    print(f"Stored nutrition of {stored} products from the cache")
+
+# One micro-batch of score_consumer. A failed batch is rolled back, and the
+# next one reconnects first if the connection was lost.
+def score_batch(connection, product_ids):
+    from calculate_scores import score_products
+
+    connection.ping(reconnect=True)
+    try:
+        return score_products(connection, product_ids)
+    except Exception:
+        if connection.open:
+            connection.rollback()
+        raise
+
+# Streaming scores: drains product ids from the scrape workers and scores them
+# in micro-batches of up to `batch_size`, waiting at most `flush_seconds` after
+# the first queued id. The dashboard snapshot is refreshed at most every
+# `snapshot_interval` seconds while new scores come in, and once at the end.
+# A failed batch or snapshot is logged and retried later instead of stopping
+# the consumer. Stops at the None marker.
+async def score_consumer(queue, batch_size=50, flush_seconds=2.0, snapshot_interval=30.0):
+    # Imported here so plain scraping runs don't load pandas/pyarrow
+    from snapshot import write_snapshot
+
+    connection = await asyncio.to_thread(connect)
+    pending = []
+    deadline = None
+    stopping = False
+    scored = 0
+    unpublished = False
+    last_snapshot = time.monotonic()
+    while not stopping:
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        try:
+            product_id = await asyncio.wait_for(queue.get(), timeout)
+            if product_id is None:
+                stopping = True
+            else:
+                pending.append(product_id)
+                deadline = deadline or time.monotonic() + flush_seconds
+        except asyncio.TimeoutError:
+            pass
+
+        if pending and (stopping or len(pending) >= batch_size or time.monotonic() >= deadline):
+            try:
+                scored += await asyncio.to_thread(score_batch, connection, pending)
+                pending = []
+                unpublished = True
+            except Exception as e:
+                # The ids stay pending and go out with the next batch
+                print(f"Scoring {len(pending)} products failed, retrying later: {e}")
+            deadline = time.monotonic() + flush_seconds if pending else None
+        if unpublished and (stopping or time.monotonic() - last_snapshot >= snapshot_interval):
+            try:
+                await asyncio.to_thread(write_snapshot)
+                unpublished = False
+            except Exception as e:
+                print(f"Refreshing the dashboard snapshot failed, retrying later: {e}")
+            last_snapshot = time.monotonic()
+
+    connection.close()
+    print(f"Scored {scored} products while scraping")
+    if pending:
+        print(f"Warning: {len(pending)} products were not scored; calculate_scores.py will pick them up")
+    if unpublished:
+        print("Warning: the dashboard snapshot is out of date; run snapshot.py to refresh it")
+    return scored
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Scrape and normalize nutrition tables of product pages.")
+    parser.add_argument("--workers", type=int, default=4,
+                        help="browser contexts loading product pages concurrently")
+    parser.add_argument("--rate", type=float, default=1.0,
+                        help="page loads per second allowed per host")
+    parser.add_argument("--burst", type=int, default=1,
+                        help="page loads allowed back to back per host")
+    parser.add_argument("--max-age-days", type=float, default=None,
+                        help="also rescrape products last fetched more than this many days ago")
+    parser.add_argument("--no-block", dest="block", action="store_false",
+                        help="load images, fonts, stylesheets and trackers too")
+    parser.add_argument("--no-http", dest="http", action="store_false",
+                        help="always load pages in the browser instead of trying plain HTTP first")
+    parser.add_argument("--replay", action="store_true",
+                        help="re-normalize and store the cached raw tables instead of loading any page")
+    parser.add_argument("--score", action="store_true",
+                        help="score products as they are scraped and keep the dashboard snapshot fresh")
+    parser.add_argument("--snapshot-interval", type=float, default=30.0,
+                        help="with --score, seconds between dashboard snapshot refreshes")
+    return parser.parse_args()
+
+# Create or migrate the tables the scraper writes to, and product_score for --score
+def prepare_tables(connection, score=False):
     with connection.cursor() as cursor:
         columns_sql = ",\n".join(
             [f"`{col}` TEXT CHARACTER SET utf8mb4 NULL" for col in CANONICAL_KEYS]
@@ -97,75 +552,88 @@ async def main():
             CREATE TABLE IF NOT EXISTS product_nutrition (
                 product_id INT PRIMARY KEY,
                 {columns_sql},
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                INDEX idx_updated_at (updated_at)
             ) CHARACTER SET=utf8mb4;
         """
         print("Creating nutrition table if not exists...")
         cursor.execute(create_table_sql)
+        # The worklist falls back to updated_at for products fetched before nutrition_fetches
+        ensure_nutrition_updated_at(cursor)
+        create_numeric_tables(cursor)
+        create_fetch_table(cursor)
+        if score:
+            # Imported here so plain scraping runs don't load pandas/pyarrow
+            from calculate_scores import create_score_table
+            create_score_table(cursor)
         connection.commit()
 
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=True)
-        page = await browser.new_page()
-
-        current_id = 1
-        max_id = 4000  # adjust max range or make it dynamic
+async def main(workers=4, rate=1.0, burst=1, max_age_days=None, block=True, score=False,
+               snapshot_interval=30.0, replay=False, http=True):
+    print("Connecting to database...")
+    connection = await asyncio.to_thread(connect)
+    # The connection (and the normalizer using it) belongs to the writer
+    # thread, so the schema setup, the key mapping and every write run off the
+    # event loop
+    writer = BackgroundWriter(connection, max_pending=workers * 4)
+    await writer.run(prepare_tables, score)
+    normalizer = KeyNormalizer(connection)
+    await writer.run(lambda connection: normalizer.load())
 
-        while current_id <= max_id:
-            with connection.cursor() as cursor:
-                cursor.execute("SELECT id, url FROM products WHERE id = %s", (current_id,))
-                prod = cursor.fetchone()
+    score_queue = asyncio.Queue() if score else None
+    scorer = asyncio.create_task(score_consumer(score_queue, snapshot_interval=snapshot_interval)) if score else None
 
-            if not prod:
-                print(f"Product with ID {current_id} not found, skipping.")
-                current_id += 1
-                continue
+    if replay:
+        await replay_raw_cache(writer, normalizer, score_queue)
+        await writer.close()
+        if scorer:
+            await score_queue.put(None)
+            await scorer
+        normalizer.report()
+        connection.close()
+        print("\nAll done!")
+        return
 
-            print(f"\nScraping nutrition for product ID {prod['id']} from {prod['url']}")
-            try:
-                await page.goto(prod['url'], timeout=60000)
-                nutrition_raw = await extract_nutrition_from_page(page)
-                if not nutrition_raw:
-                    print("No nutrition data found, skipping.")
-                    current_id += 1
-                    await asyncio.sleep(1)
-                    continue
-
-                nutrition_norm = {}
-                for raw_key, val in nutrition_raw.items():
-                    norm_key = normalize_key(raw_key)
-                    if norm_key:
-                        nutrition_norm[norm_key] = val
-                    else:
-                        print(f"Warning: Unmapped nutrition key: '{raw_key}'")
-
-                if nutrition_norm:
-                    cols = ", ".join(f"`{k}`" for k in nutrition_norm.keys())
-                    placeholders = ", ".join(["%s"] * len(nutrition_norm))
-                    sql = f"""
-                        INSERT INTO product_nutrition (product_id, {cols})
-                        VALUES (%s, {placeholders})
-                        ON DUPLICATE KEY UPDATE
-                        {', '.join(f"`{k}`=VALUES(`{k}`)" for k in nutrition_norm.keys())}
-                    """
-                    values = [prod['id']] + list(nutrition_norm.values())
-                    with connection.cursor() as cursor:
-                        cursor.execute(sql, values)
-                    connection.commit()
-                    print(f"Inserted/Updated nutrition data for product ID {prod['id']}")
-                else:
-                    print("No normalized nutrition data to insert.")
+    limiter = RateLimiter(rate, burst)
+    queue = asyncio.Queue(maxsize=workers * 4)
+    fetcher = HttpFetcher(max_connections=workers) if http else None
+    # Re-fetches of unchanged tables only bump fetched_at; losing a batch of
+    # those to a crash just means the products are fetched again.
+    fetches = BatchWriter(connection, RECORD_FETCH)
 
-            except Exception as e:
-                print(f"Error scraping product {prod['id']}: {e}")
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(headless=True)
+        contexts = [await browser.new_context() for _ in range(workers)]
 
-            current_id += 1
-            await asyncio.sleep(1)  # polite wait between requests
+        results = await asyncio.gather(
+            produce_products(queue, workers, max_age_days),
+            *(scrape_worker(f"Worker {i + 1}", context, queue, limiter, writer, fetches, normalizer, block,
+                            score_queue, fetcher)
+              for i, context in enumerate(contexts)),
+        )
+        await writer.run(lambda connection: fetches.close())
+        await writer.close()
+        if fetcher:
+            await fetcher.close()
+        if scorer:
+            await score_queue.put(None)
+            await scorer
 
+        for context in contexts:
+            await context.close()
         await browser.close()
 
+    total_paths = Counter()
+    for stats, paths in results[1:]:
+        print(stats.summary())
+        total_paths.update(paths)
+    print(f"Fetch paths: {total_paths['http']} products over HTTP, {total_paths['browser']} in the browser")
+    normalizer.report()
     connection.close()
     print("\nAll done!")
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    args = parse_args()
+    asyncio.run(main(**vars(args)))
+    print(QUERY_STATS.summary())
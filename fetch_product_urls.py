@@ -1,73 +1,57 @@
+import argparse
 import asyncio
+from functools import partial
 from playwright.async_api import async_playwright
-import pymysql
-
-async def scroll_to_load_all_products(page):
-    last_height = 0
-    same_height_count = 0
-    while same_height_count < 5:
-        current_height = await page.evaluate("document.body.scrollHeight")
-        await page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
-        print(f"Scrolled to height: {current_height}")
-
-        if current_height != last_height:
-            last_height = current_height
-            same_height_count = 0
-        else:
-            same_height_count += 1
-
-        await asyncio.sleep(0.8)  # increased wait time here
-    print("Finished scrolling.")
-
-
-async def scrape_products_from_url(page, url):
-    print(f"Opening page: {url}")
-    await page.goto(url, timeout=60000)
-
-    print("Scrolling to load all products...")
-    await scroll_to_load_all_products(page)
 
+from db import QUERY_STATS, BackgroundWriter, connect, ensure_index
+from price_parsing import ensure_price_columns, parse_price
+from product_fields import derive_fields, ensure_field_columns, load_url_index
+from scraping import (add_crawl_args, check_failed_categories, crawl_categories, print_scroll_summary,
+                      remaining_categories, store_on_writer)
+
+# Insert the products of one category that aren't in `url_index` yet, and add
+# them to it. Products seen by an earlier run are left alone (update_prices.py
+# keeps their prices), so rerunning discovery never duplicates the catalog.
+def store_products(connection, products, url_index):
+    # A product listed twice on a page is only inserted once
+    products = [product for product in {product['url']: product for product in products}.values()
+                if product['url'] not in url_index]
+    if not products:
+        print("No new products")
+        return
+    # A failed category is retried, so never leave half of it in the transaction
     try:
-        await page.wait_for_selector(".product", timeout=10000)
+        with connection.cursor() as cursor:
+            # pymysql sends executemany on an INSERT ... VALUES as multi-row statements
+            cursor.executemany(
+                """
+                INSERT INTO products (name, price, price_cents, price_unit, url, image_url,
+                                      main_category, weight_g, display_image_url)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+                """,
+                [(product['name'], product['price'], *parse_price(product['price']),
+                  product['url'], product['image_url'],
+                  *derive_fields(product['name'], product['url'], product['image_url']))
+                 for product in products]
+            )
+            placeholders = ", ".join(["%s"] * len(products))
+            cursor.execute(f"SELECT id, url FROM products WHERE url IN ({placeholders})",
+                           [product['url'] for product in products])
+            new_ids = {row['url']: row['id'] for row in cursor.fetchall()}
+            connection.commit()
     except Exception:
-        print("Warning: No products found or timeout.")
-
-    count = await page.evaluate('document.querySelectorAll(".product").length')
-    print(f"Found {count} products")
-
-    products = await page.evaluate('''() => {
-        const prods = [...document.querySelectorAll(".product")];
-        return prods.map(product => {
-            const nameElem = product.querySelector("h4.product__title a");
-            const name = nameElem?.innerText.trim() || null;
-
-            const urlPart = nameElem?.getAttribute("href") || null;
-            const fullUrl = urlPart ? new URL(urlPart, "https://www.sklavenitis.gr").href : null;
-
-            const priceElem = product.querySelector(".price[data-price]") || product.querySelector(".main-price .price");
-            const price = priceElem?.innerText.trim() || null;
-
-            const imgElem = product.querySelector("figure.product__figure a img");
-            const imgSrc = imgElem?.getAttribute("src") || null;
-            const fullImgUrl = imgSrc ? (imgSrc.startsWith("http") ? imgSrc : new URL(imgSrc, "https://www.sklavenitis.gr").href) : null;
-
-            return (name && fullUrl && price) ? {name, price, url: fullUrl, image_url: fullImgUrl} : null;
-        }).filter(Boolean);
-    }''')
-    return products
-
-async def main():
-    # Connect to DB
-    connection = pymysql.connect(
-        host='localhost',
-        user='root',
-        password='1234',
-        database='groceryscore',
-        port=3307,
-        charset='utf8mb4',
-        cursorclass=pymysql.cursors.DictCursor
-    )
-
+        connection.rollback()
+        raise
+    url_index.update(new_ids)
+    print(f"Inserted {len(products)} new products")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Scrape all products of every category into the products table.")
+    add_crawl_args(parser)
+    return parser.parse_args()
+
+# Create or migrate the tables, then return the categories to crawl
+def prepare_tables(connection):
     with connection.cursor() as cursor:
         # Create products table if not exists
         cursor.execute('''
@@ -75,43 +59,61 @@ async def main():
                 id INT AUTO_INCREMENT PRIMARY KEY,
                 name TEXT CHARACTER SET utf8mb4 NOT NULL,
                 price VARCHAR(255) CHARACTER SET utf8mb4 NOT NULL,
+                price_cents INT NULL,
+                price_unit VARCHAR(32) CHARACTER SET utf8mb4 NULL,
                 url TEXT CHARACTER SET utf8mb4 NOT NULL,
                 image_url TEXT CHARACTER SET utf8mb4 DEFAULT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                main_category VARCHAR(128) CHARACTER SET utf8mb4 NULL,
+                weight_g INT NULL,
+                display_image_url TEXT CHARACTER SET utf8mb4 NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                INDEX idx_url (url(255)),
+                INDEX idx_main_category (main_category),
+                INDEX idx_price_cents (price_cents),
+                INDEX idx_price_unit (price_unit)
             );
         ''')
+        # Products are looked up by url to skip the ones already stored
+        ensure_index(cursor, 'products', 'idx_url', '`url`(255)')
+        ensure_price_columns(cursor, 'products')
+        ensure_field_columns(cursor)
         connection.commit()
 
         # Fetch all categories URLs from your table
         cursor.execute("SELECT id, parent_category, sub_category, url FROM categories")
-        categories = cursor.fetchall()
+        return cursor.fetchall()
 
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=True)
-        page = await browser.new_page()
+async def main(concurrency=4, retries=2, block=True, max_wait=120.0, checkpoint=None):
+    # Connect to DB. All DB work, including the schema setup, runs on a writer
+    # thread, so it doesn't hold up page loads in the event loop
+    connection = await asyncio.to_thread(connect)
+    writer = BackgroundWriter(connection)
+    categories = remaining_categories(await writer.run(prepare_tables), checkpoint)
 
-        for cat in categories:
-            print(f"\nScraping category {cat['id']}: {cat['parent_category']} > {cat['sub_category']}")
-            products = await scrape_products_from_url(page, cat['url'])
-            print(f"Extracted {len(products)} products from category {cat['sub_category']}")
+    url_index = await writer.run(load_url_index)
+    print(f"Loaded {len(url_index)} known product URLs")
 
-            with connection.cursor() as cursor:
-                for i, product in enumerate(products, start=1):
-                    cursor.execute(
-                        """
-                        INSERT INTO products (name, price, url, image_url)
-                        VALUES (%s, %s, %s, %s)
-                        """,
-                        (product['name'], product['price'], product['url'], product['image_url'])
-                    )
-                    if i % 10 == 0 or i == len(products):
-                        print(f"Inserted {i}/{len(products)} products")
+    # Runs on the writer thread, which is also the only one using url_index
+    on_category = store_on_writer(writer, partial(store_products, url_index=url_index), checkpoint)
 
-                connection.commit()
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(headless=True)
+        category_metrics, failed = await crawl_categories(
+            browser, categories,
+            on_category,
+            concurrency, retries, block, max_wait,
+        )
 
         await browser.close()
 
+    print_scroll_summary(category_metrics)
+
+    await writer.close()
     connection.close()
-    print("\n✅ All categories scraped and products inserted.")
+    check_failed_categories(failed, checkpoint)
+    print("\n✅ All categories scraped and new products inserted.")
 
-asyncio.run(main())
+if __name__ == "__main__":
+    args = parse_args()
+    asyncio.run(main(**vars(args)))
+    print(QUERY_STATS.summary())
@@ -0,0 +1,36 @@
+# Canonical nutrient labels; each one is a column of product_nutrition
+CANONICAL_KEYS = [
+    "Εδώδιμες ίνες",
+    "Πρωτεΐνες",
+    "Βιταμίνη D2",
+    "Υδατάνθρακες",
+    "Φολικό οξύ (Δ.Τ.Α.)*",
+    "ω-3 λιπαρά οξέα (α-λινολενικό οξύ)",
+    "Βιταμίνη Β6 (Δ.Τ.Α.)*",
+    "Πολυακόρεστα",
+    "Βιταμίνη E (Δ.Τ.Α.)**",
+    "Μονοακόρεστα",
+    "Κορεσμένα",
+    "Ω-3 (EPA, DHA)**",
+    "εκ των οποίων σάκχαρα",
+    "Ενέργεια",
+    "Βιταμίνες",
+    "Βιταμίνη C (Π.Π.Α.)*",
+    "εκ των οποίων κορεσμένα",
+    "ω-6 λιπαρά οξέα (α-λινελαϊκό οξύ)",
+    "Ριβοφλαβίνη (B2)",
+    "Νιασίνη (Δ.Τ.Α.)*",
+    "Φυτικές ίνες",
+    "Αλάτι",
+    "Βιταμίνη Α (Δ.Τ.Α.)**",
+    "Ασβέστιο",
+    "Λιπαρά εκ των οποίων",
+    "Ανόργανα συστατικά",
+    "εκ των οποίων πολυόλες",
+    "Βιταμίνη Β12",
+    "Λιπαρά",
+    "Βιταμίνη D (Δ.Τ.Α.)**",
+    "Ασβέστιο (Δ.Τ.Α.)*",
+    "Βιταμίνη Β2 (Δ.Τ.Α.)*",
+    "Σίδηρος (Δ.Τ.Α.)*"
+]
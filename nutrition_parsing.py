@@ -0,0 +1,227 @@
+import argparse
+import re
+from collections import Counter
+
+from db import BATCH_SIZE, QUERY_STATS, connect, ensure_column, ensure_index
+from nutrition_keys import CANONICAL_KEYS
+
+ENERGY_KEY = "Ενέργεια"
+
+# Every canonical nutrient except energy is stored in grams per 100g
+MASS_KEYS = [key for key in CANONICAL_KEYS if key != ENERGY_KEY]
+
+# Unit spellings seen on product pages -> canonical unit
+UNIT_ALIASES = {
+    "kj": "kJ",
+    "kcal": "kcal",
+    "g": "g",
+    "gr": "g",
+    "γρ": "g",
+    "mg": "mg",
+    "µg": "µg",
+    "μg": "µg",
+    "ug": "µg",
+    "mcg": "µg",
+}
+
+GRAMS_PER_UNIT = {"g": 1.0, "mg": 1e-3, "µg": 1e-6}
+
+# Words meaning "present in negligible amounts"
+TRACE_WORDS = ("ίχνη", "ιχνη", "traces")
+
+AMOUNT_RE = re.compile(r"(\d+(?:[.,]\d+)*)\s*([a-zα-ωµ%]+)?", re.IGNORECASE)
+
+# Parse a number written either as "0,5" / "0.5" or with a thousands dot "1.234"
+def parse_number(text, unit=None):
+    if "." in text and "," in text:
+        text = text.replace(".", "").replace(",", ".")
+    elif "," in text:
+        text = text.replace(",", ".")
+    elif re.fullmatch(r"[1-9]\d{0,2}(\.\d{3})+", text) and unit not in (None, "g"):
+        # Grams never exceed 100 per 100g, so a dot there is always decimal
+        text = text.replace(".", "")
+    return float(text)
+
+# Pull (value, unit) pairs out of a raw nutrition value
+def parse_amounts(text):
+    amounts = []
+    for number, unit in AMOUNT_RE.findall(text.replace("\u202f", "").replace("\xa0", " ")):
+        if unit == "%":
+            # Percentages of the daily intake are not amounts
+            continue
+        if unit:
+            unit = UNIT_ALIASES.get(unit.lower(), unit)
+        else:
+            unit = None
+        try:
+            amounts.append((parse_number(number, unit), unit))
+        except ValueError:
+            continue
+    return amounts
+
+# Energy text -> {'energy_kj': ..., 'energy_kcal': ...}, or an error reason
+def parse_energy(text):
+    values = {"energy_kj": None, "energy_kcal": None}
+    for value, unit in parse_amounts(text):
+        if unit == "kJ" and values["energy_kj"] is None:
+            values["energy_kj"] = value
+        elif unit == "kcal" and values["energy_kcal"] is None:
+            values["energy_kcal"] = value
+    if values["energy_kj"] is None and values["energy_kcal"] is None:
+        return values, "no kJ or kcal amount"
+    return values, None
+
+# Mass text -> grams, or an error reason
+def parse_mass(text):
+    lowered = text.lower()
+    if any(word in lowered for word in TRACE_WORDS):
+        return 0.0, None
+    amounts = parse_amounts(text)
+    if not amounts:
+        return None, "no numeric amount"
+    value, unit = amounts[0]
+    if unit is None:
+        # A bare number in a nutrition table is grams per 100g
+        unit = "g"
+    if unit not in GRAMS_PER_UNIT:
+        return None, f"unexpected unit {unit}"
+    return value * GRAMS_PER_UNIT[unit], None
+
+# Parse the raw text values of one product (canonical key -> text).
+# Returns the numeric columns to store and a list of (nutrient, raw, reason) failures.
+def parse_nutrition_row(raw):
+    numeric = {}
+    errors = []
+    for key, text in raw.items():
+        if key not in CANONICAL_KEYS:
+            continue
+        text = (text or "").strip()
+        if key == ENERGY_KEY:
+            if not text:
+                numeric.update(energy_kj=None, energy_kcal=None)
+                continue
+            values, error = parse_energy(text)
+            numeric.update(values)
+        else:
+            if not text:
+                numeric[key] = None
+                continue
+            numeric[key], error = parse_mass(text)
+        if error:
+            errors.append((key, text, error))
+    return numeric, errors
+
+# Change tracking on product_nutrition, for tables created before it existed.
+# The scraper's worklist, this backfill and incremental scoring all read it.
+def ensure_nutrition_updated_at(cursor):
+    ensure_column(cursor, 'product_nutrition', 'updated_at',
+                  "TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP")
+    ensure_index(cursor, 'product_nutrition', 'idx_updated_at', '`updated_at`')
+
+def create_numeric_tables(cursor):
+    mass_columns = ",\n".join(f"`{key}` DOUBLE NULL" for key in MASS_KEYS)
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS product_nutrition_numeric (
+            product_id INT PRIMARY KEY,
+            energy_kj DOUBLE NULL,
+            energy_kcal DOUBLE NULL,
+            {mass_columns},
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            FOREIGN KEY (product_id) REFERENCES product_nutrition(product_id) ON DELETE CASCADE
+        ) CHARACTER SET=utf8mb4;
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS nutrition_parse_errors (
+            product_id INT NOT NULL,
+            nutrient VARCHAR(255) NOT NULL,
+            raw_value TEXT,
+            reason VARCHAR(255) NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (product_id, nutrient),
+            FOREIGN KEY (product_id) REFERENCES product_nutrition(product_id) ON DELETE CASCADE
+        ) CHARACTER SET=utf8mb4;
+    """)
+
+# Upsert the parsed columns of one product and replace its recorded failures.
+# Only the columns present in `numeric` are touched, like the raw upsert.
+def store_numeric(cursor, product_id, numeric, errors):
+    if numeric:
+        cols = ", ".join(f"`{k}`" for k in numeric)
+        placeholders = ", ".join(["%s"] * len(numeric))
+        updates = ", ".join(f"`{k}`=VALUES(`{k}`)" for k in numeric)
+        cursor.execute(f"""
+            INSERT INTO product_nutrition_numeric (product_id, {cols})
+            VALUES (%s, {placeholders})
+            ON DUPLICATE KEY UPDATE {updates}, updated_at=CURRENT_TIMESTAMP
+        """, [product_id] + list(numeric.values()))
+
+    nutrients = [ENERGY_KEY if k in ("energy_kj", "energy_kcal") else k for k in numeric]
+    nutrients = list(dict.fromkeys(nutrients))
+    if nutrients:
+        placeholders = ", ".join(["%s"] * len(nutrients))
+        cursor.execute(
+            f"DELETE FROM nutrition_parse_errors WHERE product_id = %s AND nutrient IN ({placeholders})",
+            [product_id] + nutrients,
+        )
+    if errors:
+        cursor.executemany("""
+            INSERT INTO nutrition_parse_errors (product_id, nutrient, raw_value, reason)
+            VALUES (%s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE raw_value=VALUES(raw_value), reason=VALUES(reason)
+        """, [(product_id, key, text, reason) for key, text, reason in errors])
+
+def parse_and_store(cursor, product_id, raw):
+    numeric, errors = parse_nutrition_row(raw)
+    store_numeric(cursor, product_id, numeric, errors)
+    return numeric, errors
+
+# Parse raw rows that have no numeric row yet or changed since they were parsed
+def backfill_numeric(connection, reparse_all=False, batch_size=BATCH_SIZE):
+    with connection.cursor() as cursor:
+        ensure_nutrition_updated_at(cursor)
+        create_numeric_tables(cursor)
+        connection.commit()
+
+        where = "" if reparse_all else "WHERE n.product_id IS NULL OR n.updated_at < pn.updated_at"
+        cursor.execute(f"""
+            SELECT pn.product_id FROM product_nutrition pn
+            LEFT JOIN product_nutrition_numeric n ON n.product_id = pn.product_id
+            {where}
+        """)
+        product_ids = [row['product_id'] for row in cursor.fetchall()]
+
+        columns = ", ".join(f"`{key}`" for key in CANONICAL_KEYS)
+        reasons = Counter()
+        for start in range(0, len(product_ids), batch_size):
+            batch = product_ids[start:start + batch_size]
+            placeholders = ", ".join(["%s"] * len(batch))
+            cursor.execute(
+                f"SELECT product_id, {columns} FROM product_nutrition WHERE product_id IN ({placeholders})",
+                batch,
+            )
+            for row in cursor.fetchall():
+                product_id = row.pop('product_id')
+                _, errors = parse_and_store(cursor, product_id, row)
+                reasons.update(reason for _, _, reason in errors)
+            connection.commit()
+
+    print(f"Parsed nutrition values for {len(product_ids)} products")
+    for reason, count in reasons.most_common():
+        print(f"  {count} values failed to parse: {reason}")
+    return len(product_ids)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Parse raw nutrition text into product_nutrition_numeric.")
+    parser.add_argument("--all", dest="reparse_all", action="store_true",
+                        help="reparse every product, not only new or changed rows")
+    return parser.parse_args()
+
+def main(reparse_all=False):
+    connection = connect()
+    backfill_numeric(connection, reparse_all)
+    connection.close()
+
+if __name__ == "__main__":
+    args = parse_args()
+    main(**vars(args))
+    print(QUERY_STATS.summary())
@@ -0,0 +1,166 @@
+import argparse
+import asyncio
+import inspect
+import time
+import traceback
+
+import calculate_scores
+import export_catalog
+import fetch_nutrition_data
+import fetch_product_urls
+import update_prices
+from db import QUERY_STATS, StageCheckpoint, connect, create_pipeline_tables, get_pool
+from snapshot import write_snapshot
+
+# Runs the whole pipeline as a dependency graph: a stage starts as soon as the
+# stages it depends on are done, so independent ones (price refresh and the
+# nutrition scrape) run side by side. Stage state is kept in pipeline_stages,
+# and after a failure `--resume` continues the same run: finished stages are
+# skipped and the category crawls skip the categories they already stored
+# (pipeline_checkpoints). The nutrition scrape resumes from nutrition_fetches
+# and scoring from its watermark, so they need no checkpoints of their own.
+#
+# There is no categories stage: fetch_categories.py is empty in this tree, so
+# the categories table has to be filled beforehand.
+
+class Stage:
+    def __init__(self, name, run, deps=(), kwargs=None, checkpointed=False):
+        self.name = name
+        self.run = run
+        self.deps = deps
+        self.kwargs = kwargs or {}
+        # Whether `run` takes a checkpoint= to skip items done in this run
+        self.checkpointed = checkpointed
+
+STAGES = [
+    Stage("product_urls", fetch_product_urls.main, checkpointed=True),
+    Stage("nutrition", fetch_nutrition_data.main, deps=("product_urls",)),
+    Stage("prices", update_prices.main, deps=("product_urls",), kwargs={"snapshot": False}, checkpointed=True),
+    Stage("scores", calculate_scores.main, deps=("nutrition",), kwargs={"snapshot": False}),
+    Stage("snapshot", write_snapshot, deps=("scores", "prices")),
+    Stage("export", export_catalog.main, deps=("scores", "prices")),
+]
+
+# Statuses a dependent stage may start after
+FINISHED = ("done", "skipped")
+
+# -> (run id, {stage: status} of stages that already finished in it)
+def start_run(connection, resume):
+    with connection.cursor() as cursor:
+        if resume:
+            cursor.execute("SELECT id FROM pipeline_runs WHERE status <> 'done' ORDER BY id DESC LIMIT 1")
+            row = cursor.fetchone()
+            if row:
+                cursor.execute("UPDATE pipeline_runs SET status = 'running' WHERE id = %s", (row['id'],))
+                cursor.execute("SELECT stage, status FROM pipeline_stages WHERE run_id = %s", (row['id'],))
+                finished = {r['stage']: r['status'] for r in cursor.fetchall() if r['status'] in FINISHED}
+                print(f"Resuming run {row['id']} ({len(finished)} stages already finished)")
+                return row['id'], finished
+            print("No unfinished run to resume, starting a new one")
+        cursor.execute("INSERT INTO pipeline_runs () VALUES ()")
+        return cursor.lastrowid, {}
+
+# Called from the stage tasks through asyncio.to_thread, so every update
+# borrows its own connection from the pool
+def set_stage(run_id, stage, status, seconds=None, error=None):
+    with get_pool().connection() as connection:
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                INSERT INTO pipeline_stages (run_id, stage, status, seconds, error)
+                VALUES (%s, %s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE status=VALUES(status), seconds=VALUES(seconds), error=VALUES(error)
+            """, (run_id, stage, status, seconds, error))
+        connection.commit()
+
+# The scraper stages share this event loop, so the orchestrator's own queries
+# run on threads too
+async def run_pipeline(run_id, finished, skip=()):
+    results = {name: (status, None) for name, status in finished.items()}
+    events = {stage.name: asyncio.Event() for stage in STAGES}
+
+    async def run(stage):
+        try:
+            for dep in stage.deps:
+                await events[dep].wait()
+            if stage.name in finished:
+                print(f"[{stage.name}] already finished in this run")
+                return
+            if stage.name in skip:
+                results[stage.name] = ("skipped", None)
+                await asyncio.to_thread(set_stage, run_id, stage.name, "skipped")
+                return
+            blocked = [dep for dep in stage.deps if results[dep][0] not in FINISHED]
+            if blocked:
+                print(f"[{stage.name}] not run: {', '.join(blocked)} did not finish")
+                results[stage.name] = ("blocked", None)
+                await asyncio.to_thread(set_stage, run_id, stage.name, "blocked")
+                return
+
+            print(f"\n[{stage.name}] starting")
+            await asyncio.to_thread(set_stage, run_id, stage.name, "running")
+            kwargs = dict(stage.kwargs)
+            if stage.checkpointed:
+                kwargs["checkpoint"] = await asyncio.to_thread(StageCheckpoint, get_pool(), run_id, stage.name)
+            started = time.perf_counter()
+            try:
+                if inspect.iscoroutinefunction(stage.run):
+                    await stage.run(**kwargs)
+                else:
+                    await asyncio.to_thread(stage.run, **kwargs)
+            except Exception as e:
+                seconds = time.perf_counter() - started
+                traceback.print_exc()
+                print(f"[{stage.name}] failed after {seconds:.0f}s: {e}")
+                results[stage.name] = ("failed", seconds)
+                await asyncio.to_thread(set_stage, run_id, stage.name, "failed", seconds, str(e))
+                return
+            seconds = time.perf_counter() - started
+            print(f"[{stage.name}] done in {seconds:.0f}s")
+            results[stage.name] = ("done", seconds)
+            await asyncio.to_thread(set_stage, run_id, stage.name, "done", seconds)
+        finally:
+            events[stage.name].set()
+
+    await asyncio.gather(*(run(stage) for stage in STAGES))
+    return results
+
+def print_timings(results):
+    print("\nStage timings:")
+    for stage in STAGES:
+        status, seconds = results.get(stage.name, ("-", None))
+        timing = f"{seconds:8.1f}s" if seconds is not None else " " * 9
+        print(f"  {stage.name:<14} {timing}  {status}")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run the scraping and scoring pipeline as one resumable run.")
+    parser.add_argument("--resume", action="store_true",
+                        help="continue the latest unfinished run instead of starting a new one")
+    parser.add_argument("--skip", action="append", default=[], choices=[stage.name for stage in STAGES],
+                        help="don't run this stage (can be repeated); stages after it still run")
+    return parser.parse_args()
+
+def main(resume=False, skip=()):
+    connection = connect(autocommit=True)
+    with connection.cursor() as cursor:
+        create_pipeline_tables(cursor)
+    run_id, finished = start_run(connection, resume)
+
+    started = time.perf_counter()
+    results = asyncio.run(run_pipeline(run_id, finished, set(skip)))
+    ok = all(status in FINISHED for status, _ in results.values())
+    with connection.cursor() as cursor:
+        cursor.execute("UPDATE pipeline_runs SET status = %s, finished_at = NOW() WHERE id = %s",
+                       ("done" if ok else "failed", run_id))
+    connection.close()
+    get_pool().close()
+
+    print_timings(results)
+    print(QUERY_STATS.summary())
+    print(f"Run {run_id} {'finished' if ok else 'failed'} in {time.perf_counter() - started:.0f}s"
+          + ("" if ok else "; fix the cause and rerun with --resume"))
+    if not ok:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    args = parse_args()
+    main(**vars(args))
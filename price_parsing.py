@@ -0,0 +1,94 @@
+import argparse
+import re
+from decimal import Decimal, InvalidOperation
+
+from db import BATCH_SIZE, QUERY_STATS, connect, ensure_column, ensure_index
+
+PRICE_RE = re.compile(r"\d[\d.,]*")
+
+# Price text as shown on the site ("4,73 € /τεμ.", "1.234,50 €/κιλό") ->
+# (integer cents, unit label such as "/τεμ."). Unparseable prices give (None, None).
+def parse_price(text):
+    if not text:
+        return None, None
+    match = PRICE_RE.search(text)
+    if not match:
+        return None, None
+    number = match.group(0).rstrip(".,")
+    if "," in number:
+        # Greek format: dots group thousands, the comma is the decimal point
+        number = number.replace(".", "").replace(",", ".")
+    elif re.search(r"\.\d{3}$", number):
+        number = number.replace(".", "")
+    try:
+        cents = int((Decimal(number) * 100).to_integral_value())
+    except InvalidOperation:
+        return None, None
+    unit = (text[:match.start()] + text[match.end():]).replace("€", "").strip()
+    return cents, unit or None
+
+# Add the numeric price columns to a table created by an older version
+def ensure_price_columns(cursor, table):
+    ensure_column(cursor, table, 'price_cents', "INT NULL")
+    ensure_column(cursor, table, 'price_unit', "VARCHAR(32) CHARACTER SET utf8mb4 NULL")
+    ensure_index(cursor, table, 'idx_price_cents', '`price_cents`')
+    ensure_index(cursor, table, 'idx_price_unit', '`price_unit`')
+
+# Fill price_cents/price_unit of rows written before the columns existed.
+# Walks the table by id so unparseable prices are visited only once.
+def backfill_prices(connection, table, batch_size=BATCH_SIZE):
+    last_id = 0
+    updated = 0
+    failed = 0
+    with connection.cursor() as cursor:
+        while True:
+            cursor.execute(f"""
+                SELECT id, price FROM {table}
+                WHERE price_cents IS NULL AND id > %s
+                ORDER BY id LIMIT %s
+            """, (last_id, batch_size))
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            last_id = rows[-1]['id']
+
+            parsed = [(row['id'], *parse_price(row['price'])) for row in rows]
+            failed += sum(1 for _, cents, _ in parsed if cents is None)
+            parsed = [row for row in parsed if row[1] is not None]
+            if parsed:
+                cents_cases = " ".join(["WHEN %s THEN %s"] * len(parsed))
+                unit_cases = " ".join(["WHEN %s THEN %s"] * len(parsed))
+                placeholders = ", ".join(["%s"] * len(parsed))
+                params = [v for pid, cents, _ in parsed for v in (pid, cents)]
+                params += [v for pid, _, unit in parsed for v in (pid, unit)]
+                params += [pid for pid, _, _ in parsed]
+                cursor.execute(f"""
+                    UPDATE {table}
+                    SET price_cents = CASE id {cents_cases} END,
+                        price_unit = CASE id {unit_cases} END
+                    WHERE id IN ({placeholders})
+                """, params)
+                updated += len(parsed)
+            connection.commit()
+    print(f"{table}: parsed {updated} prices, {failed} could not be parsed")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Backfill numeric prices on products and product_prices.")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="rows updated per statement")
+    return parser.parse_args()
+
+def main(batch_size=BATCH_SIZE):
+    connection = connect()
+    with connection.cursor() as cursor:
+        for table in ('products', 'product_prices'):
+            ensure_price_columns(cursor, table)
+    connection.commit()
+
+    for table in ('products', 'product_prices'):
+        backfill_prices(connection, table, batch_size)
+    connection.close()
+
+if __name__ == "__main__":
+    args = parse_args()
+    main(**vars(args))
+    print(QUERY_STATS.summary())
@@ -0,0 +1,91 @@
+import argparse
+import re
+
+from db import BATCH_SIZE, QUERY_STATS, connect, ensure_column, ensure_index
+
+SITE_URL = "https://www.sklavenitis.gr/"
+WEIGHT_RE = re.compile(r"(\d+)\s*(g|gr)", re.IGNORECASE)
+
+# Columns the dashboard shows that only depend on the product row itself
+FIELD_COLUMNS = ('main_category', 'weight_g', 'display_image_url')
+
+# Category slug from the product url, e.g. ".../trofima-pantopoleioy/..." -> "trofima-pantopoleioy"
+def main_category(url):
+    if not url:
+        return ""
+    return url.replace(SITE_URL, "").split('/')[0]
+
+# Package weight in grams from the product name ("Φέτα 400g"), None if not stated
+def weight_g(name):
+    match = WEIGHT_RE.search(name or "")
+    return int(match.group(1)) if match else None
+
+# The site's full-size image instead of the thumbnail the listing links to
+def display_image_url(image_url):
+    if not image_url:
+        return image_url
+    return image_url.replace('/Product/', '/1600x1600/', 1)
+
+# (main_category, weight_g, display_image_url) in FIELD_COLUMNS order
+def derive_fields(name, url, image_url):
+    return main_category(url), weight_g(name), display_image_url(image_url)
+
+# Add the derived columns to a products table created by an older version
+def ensure_field_columns(cursor):
+    ensure_column(cursor, 'products', 'main_category', "VARCHAR(128) CHARACTER SET utf8mb4 NULL")
+    ensure_column(cursor, 'products', 'weight_g', "INT NULL")
+    ensure_column(cursor, 'products', 'display_image_url', "TEXT CHARACTER SET utf8mb4 NULL")
+    ensure_index(cursor, 'products', 'idx_main_category', '`main_category`')
+
+# url -> product id for every known product, loaded once per run by the scrapers
+def load_url_index(connection):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT id, url FROM products")
+        return {row['url']: row['id'] for row in cursor.fetchall()}
+
+# Derive the columns for products written before they existed. The scrapers
+# fill them when a product is inserted, so only rows with main_category NULL
+# are visited, unless recompute_all (after changing one of the rules above).
+def backfill_fields(connection, recompute_all=False, batch_size=BATCH_SIZE):
+    last_id = 0
+    updated = 0
+    with connection.cursor() as cursor:
+        while True:
+            cursor.execute(f"""
+                SELECT id, name, url, image_url FROM products
+                WHERE id > %s {'' if recompute_all else 'AND main_category IS NULL'}
+                ORDER BY id LIMIT %s
+            """, (last_id, batch_size))
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            last_id = rows[-1]['id']
+
+            cursor.executemany("""
+                UPDATE products SET main_category = %s, weight_g = %s, display_image_url = %s
+                WHERE id = %s
+            """, [(*derive_fields(row['name'], row['url'], row['image_url']), row['id']) for row in rows])
+            connection.commit()
+            updated += len(rows)
+    print(f"Derived dashboard fields for {updated} products")
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Backfill the derived dashboard columns of products.")
+    parser.add_argument("--all", dest="recompute_all", action="store_true",
+                        help="recompute every product, not only those missing the columns")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="products updated per transaction")
+    return parser.parse_args()
+
+def main(recompute_all=False, batch_size=BATCH_SIZE):
+    connection = connect()
+    with connection.cursor() as cursor:
+        ensure_field_columns(cursor)
+    connection.commit()
+
+    backfill_fields(connection, recompute_all, batch_size)
+    connection.close()
+
+if __name__ == "__main__":
+    args = parse_args()
+    main(**vars(args))
+    print(QUERY_STATS.summary())
@@ -1,48 +1,59 @@
-from sqlalchemy import create_engine
+import os
+
 import pandas as pd
 import matplotlib.pyplot as plt
 
-# DB connection details
-user = 'root'
-password = '1234'
-host = 'localhost'
-port = 3307
-db = 'groceryscore'
+from db import get_engine
+from export_catalog import MANIFEST_FILE, load_catalog
+
+# DB connection settings live in db.py
+engine = get_engine()
 
-connection_url = f"mysql+pymysql://{user}:{password}@{host}:{port}/{db}?charset=utf8mb4"
-engine = create_engine(connection_url)
+# Prefer the Parquet export (export_catalog.py): only the needed columns of the
+# current catalog are read, with no joins against the live DB
+catalog = load_catalog(columns=[
+    'product_id', 'name', 'price', 'url', 'image_url', 'score', 'grade', 'energy_kj', 'energy_kcal',
+    'protein_g', 'carbs_g', 'sugars_g', 'salt_g', 'fiber_g',
+]) if os.path.exists(MANIFEST_FILE) else None
 
-# Query top 40 products with nutrition info
-query_top40 = """
-SELECT 
-    p.id AS product_id,
-    p.name,
-    p.price,
-    p.url,
-    p.image_url,
-    ps.score,
-    ps.grade,
-    pn.Ενέργεια AS energy,
-    pn.Πρωτεΐνες AS protein,
-    pn.Υδατάνθρακες AS carbs,
-    pn.`εκ των οποίων σάκχαρα` AS sugars,
-    pn.Αλάτι AS salt,
-    pn.`Φυτικές ίνες` AS fiber
-FROM product_score ps
-JOIN products p ON ps.product_id = p.id
-JOIN product_nutrition pn ON ps.nutrition_id = pn.product_id
-ORDER BY ps.score DESC
-LIMIT 40;
-"""
+if catalog is not None:
+    print("Reading the exported catalog")
+    df_top40 = catalog.sort_values('score', ascending=False, kind='stable').head(40)
+    df_grades = catalog['grade'].value_counts().sort_index().rename_axis('grade').reset_index(name='count')
+    df_scores = catalog[['score']]
+else:
+    # Query top 40 products with nutrition info
+    query_top40 = """
+    SELECT 
+        p.id AS product_id,
+        p.name,
+        p.price,
+        p.url,
+        p.image_url,
+        ps.score,
+        ps.grade,
+        nn.energy_kj,
+        nn.energy_kcal,
+        nn.Πρωτεΐνες AS protein_g,
+        nn.Υδατάνθρακες AS carbs_g,
+        nn.`εκ των οποίων σάκχαρα` AS sugars_g,
+        nn.Αλάτι AS salt_g,
+        nn.`Φυτικές ίνες` AS fiber_g
+    FROM product_score ps
+    JOIN products p ON ps.product_id = p.id
+    JOIN product_nutrition_numeric nn ON ps.nutrition_id = nn.product_id
+    ORDER BY ps.score DESC
+    LIMIT 40;
+    """
 
-df_top40 = pd.read_sql(query_top40, engine)
+    df_top40 = pd.read_sql(query_top40, engine)
+    df_grades = pd.read_sql("SELECT grade, COUNT(*) as count FROM product_score GROUP BY grade", engine)
+    df_scores = pd.read_sql("SELECT score FROM product_score", engine)
 
 print("Top 40 Products by Nutrition Score:")
 print(df_top40.to_string(index=False))
 
 # Plot 1: Grade distribution for all products
-df_grades = pd.read_sql("SELECT grade, COUNT(*) as count FROM product_score GROUP BY grade", engine)
-
 plt.figure(figsize=(8,5))
 plt.bar(df_grades['grade'], df_grades['count'], color='skyblue')
 plt.title('Distribution of Nutrition Grades (All Products)')
@@ -52,8 +63,6 @@ plt.grid(axis='y', linestyle='--', alpha=0.7)
 plt.show()
 
 # Plot 2: Nutrition score histogram
-df_scores = pd.read_sql("SELECT score FROM product_score", engine)
-
 plt.figure(figsize=(8,5))
 plt.hist(df_scores['score'], bins=10, color='orange', edgecolor='black')
 plt.title('Histogram of Nutrition Scores')
@@ -0,0 +1,350 @@
+import asyncio
+import inspect
+import re
+import time
+from collections import Counter
+from urllib.parse import urlparse
+
+# Helpers shared by the Playwright scrapers
+
+# Token bucket per host: `rate` requests per second on average, with up to
+# `burst` requests allowed back to back. Politeness is enforced here instead of
+# with fixed sleeps, so concurrent workers share one request budget per site.
+class RateLimiter:
+    def __init__(self, rate=1.0, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.buckets = {}
+
+    async def acquire(self, url):
+        host = urlparse(url).netloc
+        while True:
+            now = time.monotonic()
+            tokens, last = self.buckets.get(host, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) * self.rate)
+            if tokens >= 1:
+                self.buckets[host] = (tokens - 1, now)
+                return
+            self.buckets[host] = (tokens, now)
+            await asyncio.sleep((1 - tokens) / self.rate)
+
+# Per-worker counters for throughput logging
+class WorkerStats:
+    def __init__(self, name):
+        self.name = name
+        self.started = time.perf_counter()
+        self.done = 0
+        self.failed = 0
+
+    def record(self, ok=True):
+        if ok:
+            self.done += 1
+        else:
+            self.failed += 1
+
+    def summary(self):
+        elapsed = time.perf_counter() - self.started
+        total = self.done + self.failed
+        per_min = total / elapsed * 60 if elapsed > 0 else 0.0
+        return (f"{self.name}: {self.done} ok, {self.failed} failed in {elapsed:.0f}s "
+                f"({per_min:.1f}/min)")
+
+# Resource types the scrapers never need: they only read DOM text and attributes
+DEFAULT_BLOCKED_TYPES = ("image", "media", "font", "stylesheet")
+
+# Analytics, ad and tracking hosts, matched anywhere in the request URL
+DEFAULT_BLOCKED_PATTERNS = (
+    r"google-analytics\.com",
+    r"googletagmanager\.com",
+    r"doubleclick\.net",
+    r"googlesyndication\.com",
+    r"adservice\.google\.",
+    r"facebook\.(net|com)/.*(tr|fbevents)",
+    r"connect\.facebook\.net",
+    r"hotjar\.com",
+    r"criteo\.(com|net)",
+    r"clarity\.ms",
+    r"tiktok\.com",
+)
+
+# Decides which requests a page may make. Allow patterns win over everything,
+# then requests are blocked by resource type or by URL pattern.
+class ResourcePolicy:
+    def __init__(self, blocked_types=DEFAULT_BLOCKED_TYPES, blocked_patterns=DEFAULT_BLOCKED_PATTERNS,
+                 allowed_patterns=()):
+        self.blocked_types = set(blocked_types)
+        self.blocked_patterns = [re.compile(p, re.IGNORECASE) for p in blocked_patterns]
+        self.allowed_patterns = [re.compile(p, re.IGNORECASE) for p in allowed_patterns]
+
+    def allows(self, resource_type, url):
+        if any(p.search(url) for p in self.allowed_patterns):
+            return True
+        if resource_type in self.blocked_types:
+            return False
+        return not any(p.search(url) for p in self.blocked_patterns)
+
+# Requests blocked and bytes actually loaded since the last take()
+class ResourceStats:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.blocked = Counter()
+        self.allowed = 0
+        self.bytes_loaded = 0
+
+    def record_response(self, response):
+        length = response.headers.get("content-length")
+        if length and length.isdigit():
+            self.bytes_loaded += int(length)
+
+    def take(self):
+        blocked = sum(self.blocked.values())
+        by_type = ", ".join(f"{count} {kind}" for kind, count in self.blocked.most_common())
+        summary = (f"Blocked {blocked} requests ({by_type or 'none'}); "
+                   f"loaded {self.allowed} requests, {self.bytes_loaded / 1024:.0f} KB")
+        self.reset()
+        return summary
+
+# Route every request of a page or browser context through the policy.
+# Returns the stats object that counts what was blocked and loaded.
+async def block_resources(target, policy=None):
+    policy = policy or ResourcePolicy()
+    stats = ResourceStats()
+
+    async def handle(route):
+        request = route.request
+        if policy.allows(request.resource_type, request.url):
+            stats.allowed += 1
+            await route.continue_()
+        else:
+            stats.blocked[request.resource_type] += 1
+            await route.abort()
+
+    await target.route("**/*", handle)
+    target.on("response", stats.record_response)
+    return stats
+
+# Scroll a category page until every product is loaded. After each scroll the
+# loop waits until either more .product cards appear or the network has been
+# quiet for `settle` seconds; a quiet network with no new cards means the list
+# is complete. `max_wait` bounds the whole thing for pathological pages.
+# Returns per-category metrics.
+async def scroll_to_load_all_products(page, max_wait=120.0, settle=0.75, poll=0.1):
+    in_flight = set()
+    last_activity = time.perf_counter()
+
+    def on_start(request):
+        nonlocal last_activity
+        in_flight.add(request)
+        last_activity = time.perf_counter()
+
+    def on_end(request):
+        nonlocal last_activity
+        in_flight.discard(request)
+        last_activity = time.perf_counter()
+
+    page.on("request", on_start)
+    page.on("requestfinished", on_end)
+    page.on("requestfailed", on_end)
+
+    started = time.perf_counter()
+    iterations = 0
+    timed_out = False
+    count = await page.evaluate('document.querySelectorAll(".product").length')
+    try:
+        while True:
+            await page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
+            iterations += 1
+
+            grew = False
+            while True:
+                await asyncio.sleep(poll)
+                current = await page.evaluate('document.querySelectorAll(".product").length')
+                now = time.perf_counter()
+                if current > count:
+                    count = current
+                    grew = True
+                    break
+                if not in_flight and now - last_activity >= settle:
+                    break
+                if now - started >= max_wait:
+                    timed_out = True
+                    break
+
+            if not grew or timed_out:
+                break
+    finally:
+        page.remove_listener("request", on_start)
+        page.remove_listener("requestfinished", on_end)
+        page.remove_listener("requestfailed", on_end)
+
+    metrics = {
+        "iterations": iterations,
+        "seconds": round(time.perf_counter() - started, 2),
+        "products": count,
+        "timed_out": timed_out,
+    }
+    print(f"Finished scrolling: {count} products after {iterations} scrolls in {metrics['seconds']}s"
+          + (" (hit max wait)" if timed_out else ""))
+    return metrics
+
+def print_scroll_summary(category_metrics):
+    if not category_metrics:
+        return
+    total = sum(m["seconds"] for m in category_metrics)
+    slowest = max(category_metrics, key=lambda m: m["seconds"])
+    timed_out = sum(1 for m in category_metrics if m["timed_out"])
+    print(f"Loaded {len(category_metrics)} categories in {total:.0f}s of scrolling "
+          f"(slowest: {slowest['category']} {slowest['seconds']}s, {timed_out} hit max wait)")
+
+# Load a category page and extract its product cards -> (products, scroll metrics)
+async def scrape_products_from_url(page, url, max_wait=120.0):
+    print(f"Opening page: {url}")
+    await page.goto(url, timeout=60000)
+
+    try:
+        await page.wait_for_selector(".product", timeout=10000)
+    except Exception:
+        print("Warning: No products found or timeout.")
+
+    print("Scrolling to load all products...")
+    metrics = await scroll_to_load_all_products(page, max_wait)
+
+    products = await page.evaluate('''() => {
+        const prods = [...document.querySelectorAll(".product")];
+        return prods.map(product => {
+            const nameElem = product.querySelector("h4.product__title a");
+            const name = nameElem?.innerText.trim() || null;
+
+            const urlPart = nameElem?.getAttribute("href") || null;
+            const fullUrl = urlPart ? new URL(urlPart, "https://www.sklavenitis.gr").href : null;
+
+            const priceElem = product.querySelector(".price[data-price]") || product.querySelector(".main-price .price");
+            const price = priceElem?.innerText.trim() || null;
+
+            const imgElem = product.querySelector("figure.product__figure a img");
+            const imgSrc = imgElem?.getAttribute("src") || null;
+            const fullImgUrl = imgSrc ? (imgSrc.startsWith("http") ? imgSrc : new URL(imgSrc, "https://www.sklavenitis.gr").href) : null;
+
+            return (name && fullUrl && price) ? {name, price, url: fullUrl, image_url: fullImgUrl} : null;
+        }).filter(Boolean);
+    }''')
+    return products, metrics
+
+# Crawl categories on `concurrency` isolated browser contexts pulling from one
+# queue. `on_category(cat, products)` runs as soon as each category finishes,
+# so results reach the DB while other categories are still loading; it may
+# return an awaitable (a write on a BackgroundWriter), which is awaited before
+# the category counts as done. A failed
+# category goes to the back of the queue, up to `retries` more times, without
+# holding up the rest. A worker that dies outside a category (its browser
+# context can't be created or replaced) stops taking categories; those left
+# when every worker is gone count as failed, and the first worker error is
+# raised if none survived. Returns (per-category metrics, categories that gave up).
+async def crawl_categories(browser, categories, on_category, concurrency=4, retries=2,
+                           block=True, max_wait=120.0):
+    queue = asyncio.Queue()
+    for cat in categories:
+        queue.put_nowait((cat, 1))
+    category_metrics = []
+    failed = []
+
+    async def worker(name):
+        context = await browser.new_context()
+        resource_stats = await block_resources(context) if block else None
+        page = await context.new_page()
+        try:
+            while True:
+                item = await queue.get()
+                if item is None:
+                    break
+                cat, attempt = item
+                print(f"\n[{name}] Scraping category {cat['id']}: {cat['parent_category']} > {cat['sub_category']}")
+                try:
+                    products, metrics = await scrape_products_from_url(page, cat['url'], max_wait)
+                    print(f"[{name}] Extracted {len(products)} products from category {cat['sub_category']}")
+                    if resource_stats:
+                        print(f"[{name}] {resource_stats.take()}")
+                    stored = on_category(cat, products)
+                    if inspect.isawaitable(stored):
+                        await stored
+                    category_metrics.append({**metrics, 'category': cat['sub_category']})
+                except Exception as e:
+                    if attempt <= retries:
+                        print(f"[{name}] Category {cat['sub_category']} failed ({e}), retrying later")
+                        queue.put_nowait((cat, attempt + 1))
+                    else:
+                        print(f"[{name}] Category {cat['sub_category']} failed {attempt} times, giving up: {e}")
+                        failed.append(cat)
+                    # Start the next category on a fresh page
+                    await page.close()
+                    page = await context.new_page()
+                finally:
+                    queue.task_done()
+        finally:
+            await context.close()
+
+    workers = [asyncio.create_task(worker(f"context {i + 1}")) for i in range(concurrency)]
+    exited = asyncio.gather(*workers, return_exceptions=True)
+    # queue.join() alone would wait forever once no worker is left to empty the queue
+    joined = asyncio.ensure_future(queue.join())
+    await asyncio.wait([joined, exited], return_when=asyncio.FIRST_COMPLETED)
+    joined.cancel()
+    for _ in workers:
+        queue.put_nowait(None)
+    errors = [result for result in await exited if isinstance(result, Exception)]
+
+    while not queue.empty():
+        item = queue.get_nowait()
+        if item is not None:
+            failed.append(item[0])
+    if errors and len(errors) == len(workers):
+        raise errors[0]
+    for error in errors:
+        print(f"A crawl worker stopped: {error!r}")
+
+    if failed:
+        print(f"{len(failed)} categories failed: {', '.join(cat['sub_category'] for cat in failed)}")
+    return category_metrics, failed
+
+# Command-line options for scripts built on crawl_categories
+def add_crawl_args(parser):
+    parser.add_argument("--no-block", dest="block", action="store_false",
+                        help="load images, fonts, stylesheets and trackers too")
+    parser.add_argument("--max-wait", type=float, default=120.0,
+                        help="upper bound in seconds for loading one category")
+    parser.add_argument("--concurrency", type=int, default=4,
+                        help="categories crawled at once, each in its own browser context")
+    parser.add_argument("--retries", type=int, default=2,
+                        help="extra attempts for a category that fails")
+
+# Categories finished by an interrupted pipeline run are not crawled again
+def remaining_categories(categories, checkpoint):
+    if not checkpoint:
+        return categories
+    remaining = [cat for cat in categories if not checkpoint.is_done(cat['id'])]
+    if len(remaining) < len(categories):
+        print(f"Resuming: skipping {len(categories) - len(remaining)} categories already done")
+    return remaining
+
+# on_category for crawl_categories: `store(connection, products)` runs on the
+# writer thread, then the category is marked done in the pipeline checkpoint
+def store_on_writer(writer, store, checkpoint=None):
+    def store_category(connection, cat, products):
+        store(connection, products)
+        if checkpoint:
+            checkpoint.mark(cat['id'])
+
+    def on_category(cat, products):
+        return writer.run(store_category, cat, products)
+    return on_category
+
+# A pipeline run has to stop after a crawl with failed categories, so a resume
+# retries them; a standalone run only warns
+def check_failed_categories(failed, checkpoint):
+    if not failed:
+        return
+    print(f"\nWarning: {len(failed)} categories could not be scraped.")
+    if checkpoint:
+        raise RuntimeError(f"{len(failed)} categories could not be scraped")
@@ -0,0 +1,57 @@
+import numpy as np
+from rapidfuzz import fuzz, process
+
+from text_forms import lexical_form
+
+# Fuzzy product-name search for the dashboard. Names are normalized once
+# (accents stripped, casefolded, so "γαλα" finds "Γάλα"), a trigram inverted
+# index picks the names that share enough trigrams with the query, and only
+# those are scored with rapidfuzz in one batched call. The prefilter is a
+# heuristic: a heavily misspelled query can miss names a full scan would find.
+
+NGRAM = 3
+
+def ngrams(text):
+    return {text[i:i + NGRAM] for i in range(len(text) - NGRAM + 1)}
+
+class SearchIndex:
+    def __init__(self, names):
+        self.names = np.array([lexical_form(name) for name in names], dtype=object)
+        postings = {}
+        for i, name in enumerate(self.names):
+            for gram in ngrams(name):
+                postings.setdefault(gram, []).append(i)
+        self.postings = {gram: np.array(ids, dtype=np.int32) for gram, ids in postings.items()}
+
+    def __len__(self):
+        return len(self.names)
+
+    # Positions of names sharing at least half of the query's trigrams
+    def candidates(self, query):
+        grams = ngrams(query)
+        lists = [self.postings[gram] for gram in grams if gram in self.postings]
+        if not lists:
+            return np.empty(0, dtype=np.int64)
+        counts = np.bincount(np.concatenate(lists), minlength=len(self.names))
+        return np.flatnonzero(counts >= (len(grams) + 1) // 2)
+
+    # (positions, scores) of the names matching `query` with a partial_ratio of
+    # at least `cutoff`, best first
+    def search(self, query, cutoff=85):
+        query = lexical_form(query)
+        if not query:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        if len(query) < NGRAM:
+            # Too short to misspell: above a cutoff of 75, partial_ratio only
+            # passes names that contain it
+            ids = np.array([i for i, name in enumerate(self.names) if query in name], dtype=np.int64)
+            return ids, np.full(len(ids), 100.0)
+        ids = self.candidates(query)
+        if len(ids) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        scores = process.cdist([query], self.names[ids].tolist(), scorer=fuzz.partial_ratio,
+                               score_cutoff=cutoff, dtype=np.float32, workers=-1)[0]
+        hits = scores >= cutoff
+        ids, scores = ids[hits], scores[hits]
+        order = np.argsort(-scores, kind="stable")
+        return ids[order], scores[order]
@@ -0,0 +1,186 @@
+import argparse
+import glob
+import os
+import time
+import uuid
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+from sqlalchemy import inspect, text
+
+from db import QUERY_STATS, connect, get_engine
+from price_parsing import ensure_price_columns, parse_price
+from product_fields import SITE_URL, WEIGHT_RE, ensure_field_columns
+
+# On-disk snapshot of the dashboard data, shared by every dashboard process.
+# The pipeline writes it after calculate_scores.py / update_prices.py as
+# uncompressed Arrow IPC files named after a new data version, then points the
+# VERSION file at them. Dashboards memory-map the files and reload only when
+# VERSION changes, so they never query MySQL between pipeline runs.
+
+SNAPSHOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache", "snapshot")
+VERSION_FILE = os.path.join(SNAPSHOT_DIR, "VERSION")
+TABLES = ("products", "price_changes")
+
+PRODUCTS_QUERY = """
+SELECT
+    p.id AS product_id,
+    p.name,
+    p.price,
+    p.price_cents,
+    p.url,
+    COALESCE(p.display_image_url, p.image_url) AS image_url,
+    p.main_category IS NULL AS needs_fields,
+    p.main_category,
+    p.weight_g,
+    ps.score,
+    ps.grade,
+    pn.Ενέργεια AS energy,
+    pn.Πρωτεΐνες AS protein,
+    pn.Υδατάνθρακες AS carbs,
+    pn.`εκ των οποίων σάκχαρα` AS sugars,
+    pn.Αλάτι AS salt,
+    pn.`Φυτικές ίνες` AS fiber,
+    ROUND(nn.energy_kcal) AS kcal,
+    ROUND(ROUND(nn.energy_kcal) * p.weight_g / 100, 1) AS kcal_total
+FROM product_score ps
+JOIN products p ON ps.product_id = p.id
+JOIN product_nutrition pn ON ps.nutrition_id = pn.product_id
+LEFT JOIN product_nutrition_numeric nn ON nn.product_id = pn.product_id
+ORDER BY ps.score DESC
+LIMIT 4000;
+"""
+
+# product_latest_price is maintained by update_prices.py, so this is an indexed
+# read of one row per product
+PRICE_CHANGES_QUERY = """
+SELECT
+    l.product_id,
+    p.name,
+    l.previous_price AS old_price,
+    l.price AS new_price,
+    p.image_url,
+    l.pct_change
+FROM product_latest_price l
+JOIN products p ON p.id = l.product_id
+WHERE l.pct_change IS NOT NULL
+ORDER BY l.pct_change ASC;
+"""
+
+# Finish the products frame the way the dashboard shows it
+def prepare_products(df):
+    # main_category, weight_g and the display image are derived once at ingest
+    # (product_fields.py); products written before that are derived here, vectorized
+    missing = df['needs_fields'].astype(bool)
+    if missing.any():
+        old = df.loc[missing]
+        df.loc[missing, 'image_url'] = old['image_url'].str.replace('/Product/', '/1600x1600/', n=1, regex=False)
+        df.loc[missing, 'main_category'] = old['url'].str.replace(SITE_URL, '', regex=False).str.split('/').str[0]
+        df.loc[missing, 'weight_g'] = pd.to_numeric(old['name'].str.extract(WEIGHT_RE)[0])
+        df.loc[missing, 'kcal_total'] = (old['kcal'] * df.loc[missing, 'weight_g'] / 100).round(1)
+    df = df.drop(columns='needs_fields')
+
+    df['main_category'] = df['main_category'].fillna("")
+    # kcal per 100g, parsed at ingest into product_nutrition_numeric
+    df['kcal'] = df['kcal'].fillna(0).astype(int)
+    df['weight_g'] = df['weight_g'].fillna(0).astype(int)
+    df['kcal_total'] = df['kcal_total'].astype(float).fillna(0)
+
+    # Prices are parsed to integer cents at ingest; rows not backfilled yet are parsed here
+    missing = df['price_cents'].isna()
+    df.loc[missing, 'price_cents'] = df.loc[missing, 'price'].map(lambda price: parse_price(price)[0])
+    df['price_num'] = df['price_cents'].fillna(0) / 100
+
+    # Convert score to numeric and drop invalid rows
+    df['score'] = pd.to_numeric(df['score'], errors='coerce')
+    return df.dropna(subset=['score']).reset_index(drop=True)
+
+PRICE_CHANGES_COLUMNS = ['product_id', 'name', 'old_price', 'new_price', 'image_url', 'pct_change']
+
+# Add the products columns the queries read to a database created before they
+# existed (calculate_scores.py can run before either scraper has added them)
+def ensure_snapshot_schema():
+    connection = connect()
+    try:
+        with connection.cursor() as cursor:
+            ensure_price_columns(cursor, 'products')
+            ensure_field_columns(cursor)
+        connection.commit()
+    finally:
+        connection.close()
+
+def query_products(engine):
+    with engine.connect() as conn:
+        return prepare_products(pd.read_sql(text(PRODUCTS_QUERY), conn))
+
+# Empty until update_prices.py has created product_latest_price
+def query_price_changes(engine):
+    if not inspect(engine).has_table("product_latest_price"):
+        return pd.DataFrame(columns=PRICE_CHANGES_COLUMNS)
+    with engine.connect() as conn:
+        return pd.read_sql(text(PRICE_CHANGES_QUERY), conn)
+
+def table_path(table, version):
+    return os.path.join(SNAPSHOT_DIR, f"{table}-{version}.arrow")
+
+# Current data version, or None before the first snapshot
+def read_version():
+    try:
+        with open(VERSION_FILE, encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+# -> {table: DataFrame}, read from memory-mapped Arrow files
+def load_snapshot(version):
+    frames = {}
+    for table in TABLES:
+        with pa.memory_map(table_path(table, version)) as source:
+            frames[table] = pa.ipc.open_file(source).read_all().to_pandas()
+    return frames
+
+# Query the dashboard data once and publish it as a new version. Files of the
+# previous version are kept so a dashboard that read VERSION just before the
+# switch can still open them; anything older is removed.
+def write_snapshot(engine=None):
+    engine = engine or get_engine()
+    started = time.perf_counter()
+    ensure_snapshot_schema()
+    frames = {
+        "products": query_products(engine),
+        "price_changes": query_price_changes(engine),
+    }
+
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    previous = read_version()
+    version = f"{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    for table, df in frames.items():
+        path = table_path(table, version)
+        # Uncompressed, so readers can memory-map it
+        feather.write_feather(df, path + ".tmp", compression="uncompressed")
+        os.replace(path + ".tmp", path)
+    with open(VERSION_FILE + ".tmp", "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(VERSION_FILE + ".tmp", VERSION_FILE)
+
+    keep = {version, previous}
+    for path in glob.glob(os.path.join(SNAPSHOT_DIR, "*.arrow")):
+        if os.path.basename(path).split("-", 1)[1][:-len(".arrow")] not in keep:
+            os.remove(path)
+
+    print(f"Wrote dashboard snapshot {version} ({len(frames['products'])} products, "
+          f"{len(frames['price_changes'])} price changes) in {time.perf_counter() - started:.2f}s")
+    return version
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Write the dashboard data snapshot from the database.")
+    return parser.parse_args()
+
+def main():
+    write_snapshot()
+
+if __name__ == "__main__":
+    args = parse_args()
+    main(**vars(args))
+    print(QUERY_STATS.summary())
@@ -0,0 +1,13 @@
+import unicodedata
+
+# Text normalization shared by nutrition label matching (fetch_nutrition_data.py)
+# and product name search (search_index.py), so both compare text the same way.
+
+# Accent-, case- and whitespace-insensitive form of a text:
+# "Γάλα  Φρέσκο" -> "γαλα φρεσκο"; casefold also turns final ς into σ
+def lexical_form(text):
+    if not text:
+        return ""
+    decomposed = unicodedata.normalize("NFD", text)
+    stripped = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return " ".join(stripped.casefold().split())
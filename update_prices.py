@@ -1,73 +1,182 @@
+import argparse
 import asyncio
+from functools import partial
 from playwright.async_api import async_playwright
-import pymysql
-
-async def scroll_to_load_all_products(page):
-    last_height = 0
-    same_height_count = 0
-    while same_height_count < 5:
-        current_height = await page.evaluate("document.body.scrollHeight")
-        await page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
-        print(f"Scrolled to height: {current_height}")
-
-        if current_height != last_height:
-            last_height = current_height
-            same_height_count = 0
-        else:
-            same_height_count += 1
-
-        await asyncio.sleep(0.8)  # increased wait time here
-    print("Finished scrolling.")
-
 
-async def scrape_products_from_url(page, url):
-    print(f"Opening page: {url}")
-    await page.goto(url, timeout=60000)
+from db import BATCH_SIZE, QUERY_STATS, BackgroundWriter, connect, ensure_column, ensure_index
+from price_parsing import backfill_prices, ensure_price_columns, parse_price
+from product_fields import derive_fields, ensure_field_columns, load_url_index
+from scraping import (add_crawl_args, check_failed_categories, crawl_categories, print_scroll_summary,
+                      remaining_categories, store_on_writer)
+from snapshot import write_snapshot
 
-    print("Scrolling to load all products...")
-    await scroll_to_load_all_products(page)
+# product id -> (id, price) of its most recent product_prices row
+def load_last_prices(connection, product_ids=None):
+    query = """
+        SELECT pp.id, pp.product_id, pp.price
+        FROM product_prices pp
+        JOIN (
+            SELECT product_id, MAX(id) AS id FROM product_prices {where} GROUP BY product_id
+        ) latest ON latest.id = pp.id
+    """
+    with connection.cursor() as cursor:
+        if product_ids is None:
+            cursor.execute(query.format(where=""))
+        else:
+            placeholders = ", ".join(["%s"] * len(product_ids))
+            cursor.execute(query.format(where=f"WHERE product_id IN ({placeholders})"), list(product_ids))
+        return {row['product_id']: (row['id'], row['price']) for row in cursor.fetchall()}
 
-    try:
-        await page.wait_for_selector(".product", timeout=10000)
-    except Exception:
-        print("Warning: No products found or timeout.")
+# Current and previous price per product, kept in step with product_prices by
+# store_prices so the price-change view never has to scan the history
+LATEST_PRICE_DDL = '''
+    CREATE TABLE IF NOT EXISTS product_latest_price (
+        product_id INT PRIMARY KEY,
+        price VARCHAR(255) CHARACTER SET utf8mb4 NOT NULL,
+        price_cents INT NULL,
+        price_unit VARCHAR(32) CHARACTER SET utf8mb4 NULL,
+        previous_price VARCHAR(255) CHARACTER SET utf8mb4 NULL,
+        previous_price_cents INT NULL,
+        pct_change DECIMAL(8, 2) NULL,
+        changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        INDEX idx_pct_change (pct_change),
+        FOREIGN KEY (product_id) REFERENCES products(id) ON DELETE CASCADE
+    );
+'''
 
-    count = await page.evaluate('document.querySelectorAll(".product").length')
-    print(f"Found {count} products")
+# MySQL applies the assignments left to right, so the previous_* columns and
+# pct_change read the old price before it is overwritten. Re-recording the same
+# price (--capture all) leaves the row untouched.
+UPSERT_LATEST_PRICE = '''
+    INSERT INTO product_latest_price (product_id, price, price_cents, price_unit)
+    VALUES (%s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+        previous_price = IF(price = VALUES(price), previous_price, price),
+        previous_price_cents = IF(price = VALUES(price), previous_price_cents, price_cents),
+        pct_change = IF(price = VALUES(price), pct_change,
+                        ROUND((VALUES(price_cents) - price_cents) / NULLIF(price_cents, 0) * 100, 2)),
+        changed_at = IF(price = VALUES(price), changed_at, CURRENT_TIMESTAMP),
+        price_cents = VALUES(price_cents),
+        price_unit = VALUES(price_unit),
+        price = VALUES(price)
+'''
 
-    products = await page.evaluate('''() => {
-        const prods = [...document.querySelectorAll(".product")];
-        return prods.map(product => {
-            const nameElem = product.querySelector("h4.product__title a");
-            const name = nameElem?.innerText.trim() || null;
+# Recreate product_latest_price from the full history: the last two points
+# where each product's price changed become its current and previous price
+def rebuild_latest_prices(connection):
+    # pct_change is computed from price_cents, so parse the rows captured
+    # before that column existed first (a no-op once price_parsing.py has run)
+    backfill_prices(connection, 'product_prices')
+    with connection.cursor() as cursor:
+        cursor.execute("DELETE FROM product_latest_price")
+        cursor.execute('''
+            INSERT INTO product_latest_price
+                (product_id, price, price_cents, price_unit,
+                 previous_price, previous_price_cents, pct_change, changed_at)
+            WITH history AS (
+                SELECT id, product_id, price, price_cents, price_unit, captured_at,
+                       LAG(price) OVER (PARTITION BY product_id ORDER BY id) AS prior_price
+                FROM product_prices
+            ), changes AS (
+                SELECT *, ROW_NUMBER() OVER (PARTITION BY product_id ORDER BY id DESC) AS rn
+                FROM history
+                WHERE prior_price IS NULL OR prior_price <> price
+            )
+            SELECT cur.product_id, cur.price, cur.price_cents, cur.price_unit,
+                   prev.price, prev.price_cents,
+                   ROUND((cur.price_cents - prev.price_cents) / NULLIF(prev.price_cents, 0) * 100, 2),
+                   cur.captured_at
+            FROM changes cur
+            LEFT JOIN changes prev ON prev.product_id = cur.product_id AND prev.rn = 2
+            WHERE cur.rn = 1
+        ''')
+        rows = cursor.rowcount
+    connection.commit()
+    print(f"Rebuilt latest prices of {rows} products")
 
-            const urlPart = nameElem?.getAttribute("href") || null;
-            const fullUrl = urlPart ? new URL(urlPart, "https://www.sklavenitis.gr").href : null;
+# Insert unknown products and record prices, with multi-row statements and one
+# transaction per batch. With changes_only, a price row is written only when the
+# price differs from the product's last one; an unchanged price just bumps that
+# row's last_seen_at (NULL until then: the row was last seen when captured). product_latest_price is updated in the same transaction.
+# url_index and last_prices are updated in place.
+def store_prices(connection, products, url_index, last_prices, batch_size=BATCH_SIZE, changes_only=True):
+    # A product listed twice on a page only gets one price row
+    products = list({product['url']: product for product in products}.values())
 
-            const priceElem = product.querySelector(".price[data-price]") || product.querySelector(".main-price .price");
-            const price = priceElem?.innerText.trim() || null;
+    for start in range(0, len(products), batch_size):
+        batch = products[start:start + batch_size]
+        new_products = [product for product in batch if product['url'] not in url_index]
+        new_ids = {}
+        # A failed category is retried, so never leave half of it in the transaction
+        try:
+            with connection.cursor() as cursor:
+                if new_products:
+                    cursor.executemany('''
+                        INSERT INTO products (name, price, price_cents, price_unit, url, image_url,
+                                              main_category, weight_g, display_image_url)
+                        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+                    ''', [(p['name'], p['price'], *parse_price(p['price']), p['url'], p['image_url'],
+                           *derive_fields(p['name'], p['url'], p['image_url']))
+                          for p in new_products])
+                    placeholders = ", ".join(["%s"] * len(new_products))
+                    cursor.execute(
+                        f"SELECT id, url FROM products WHERE url IN ({placeholders})",
+                        [p['url'] for p in new_products],
+                    )
+                    new_ids = {row['url']: row['id'] for row in cursor.fetchall()}
 
-            const imgElem = product.querySelector("figure.product__figure a img");
-            const imgSrc = imgElem?.getAttribute("src") || null;
-            const fullImgUrl = imgSrc ? (imgSrc.startsWith("http") ? imgSrc : new URL(imgSrc, "https://www.sklavenitis.gr").href) : null;
+                changed = []
+                unchanged_rows = []
+                for p in batch:
+                    product_id = url_index.get(p['url']) or new_ids[p['url']]
+                    last = last_prices.get(product_id)
+                    if changes_only and last and last[1] == p['price']:
+                        unchanged_rows.append(last[0])
+                    else:
+                        changed.append((product_id, p['price'], *parse_price(p['price'])))
 
-            return (name && fullUrl && price) ? {name, price, url: fullUrl, image_url: fullImgUrl} : null;
-        }).filter(Boolean);
-    }''')
-    return products
+                if changed:
+                    # Only plain placeholders in VALUES let pymysql batch the rows
+                    # into multi-row statements; a new row's last_seen_at stays NULL,
+                    # meaning "last seen when captured"
+                    cursor.executemany('''
+                        INSERT INTO product_prices (product_id, price, price_cents, price_unit)
+                        VALUES (%s, %s, %s, %s)
+                    ''', changed)
+                    cursor.executemany(UPSERT_LATEST_PRICE, changed)
+                if unchanged_rows:
+                    placeholders = ", ".join(["%s"] * len(unchanged_rows))
+                    cursor.execute(
+                        f"UPDATE product_prices SET last_seen_at = CURRENT_TIMESTAMP WHERE id IN ({placeholders})",
+                        unchanged_rows,
+                    )
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
 
+        url_index.update(new_ids)
+        if changed:
+            last_prices.update(load_last_prices(connection, [row[0] for row in changed]))
+        print(f"Stored {start + len(batch)}/{len(products)} prices "
+              f"({len(new_products)} new products, {len(changed)} price rows, {len(unchanged_rows)} unchanged)")
 
-async def main():
-    connection = pymysql.connect(
-        host='localhost',
-        user='root',
-        password='1234',
-        database='groceryscore',
-        port=3307,
-        charset='utf8mb4',
-        cursorclass=pymysql.cursors.DictCursor
-    )
+def parse_args():
+    parser = argparse.ArgumentParser(description="Re-scrape every category and record a price snapshot per product.")
+    add_crawl_args(parser)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE,
+                        help="products written per transaction")
+    parser.add_argument("--capture", choices=["changes", "all"], default="changes",
+                        help="write a price row only when the price changed (default), or on every run")
+    parser.add_argument("--rebuild-latest", action="store_true",
+                        help="recompute product_latest_price from the full price history first")
+    parser.add_argument("--no-snapshot", dest="snapshot", action="store_false",
+                        help="don't refresh the dashboard snapshot afterwards")
+    return parser.parse_args()
 
+# Create or migrate the tables -> (whether product_latest_price has rows,
+# categories to crawl)
+def prepare_tables(connection):
     with connection.cursor() as cursor:
         # Create tables if not exist
         cursor.execute('''
@@ -75,8 +184,13 @@ async def main():
                 id INT AUTO_INCREMENT PRIMARY KEY,
                 name TEXT CHARACTER SET utf8mb4 NOT NULL,
                 price VARCHAR(255) CHARACTER SET utf8mb4 NOT NULL,
+                price_cents INT NULL,
+                price_unit VARCHAR(32) CHARACTER SET utf8mb4 NULL,
                 url TEXT CHARACTER SET utf8mb4 NOT NULL UNIQUE,
                 image_url TEXT CHARACTER SET utf8mb4 DEFAULT NULL,
+                main_category VARCHAR(128) CHARACTER SET utf8mb4 NULL,
+                weight_g INT NULL,
+                display_image_url TEXT CHARACTER SET utf8mb4 NULL,
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             );
         ''')
@@ -85,59 +199,83 @@ async def main():
                 id INT AUTO_INCREMENT PRIMARY KEY,
                 product_id INT NOT NULL,
                 price VARCHAR(255) CHARACTER SET utf8mb4 NOT NULL,
+                price_cents INT NULL,
+                price_unit VARCHAR(32) CHARACTER SET utf8mb4 NULL,
                 captured_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                last_seen_at TIMESTAMP NULL,
                 FOREIGN KEY (product_id) REFERENCES products(id) ON DELETE CASCADE
             );
         ''')
+        # Last time an unchanged price was confirmed, for tables created before it existed
+        ensure_column(cursor, 'product_prices', 'last_seen_at', "TIMESTAMP NULL")
+        ensure_index(cursor, 'product_prices', 'idx_product_captured', '`product_id`, `captured_at`')
+        # New products are looked up by url after they are inserted
+        ensure_index(cursor, 'products', 'idx_url', '`url`(255)')
+        # Numeric prices (indexes are added here for new tables too)
+        ensure_price_columns(cursor, 'products')
+        ensure_price_columns(cursor, 'product_prices')
+        # Derived dashboard columns
+        ensure_field_columns(cursor)
+        cursor.execute(LATEST_PRICE_DDL)
         connection.commit()
 
+        cursor.execute("SELECT EXISTS(SELECT 1 FROM product_latest_price) AS filled")
+        latest_filled = cursor.fetchone()['filled']
+
+    with connection.cursor() as cursor:
         # Fetch categories
         cursor.execute("SELECT id, parent_category, sub_category, url FROM categories")
         categories = cursor.fetchall()
+    return latest_filled, categories
 
-    async with async_playwright() as p:
-        browser = await p.chromium.launch(headless=True)
-        page = await browser.new_page()
+async def main(concurrency=4, retries=2, block=True, max_wait=120.0, batch_size=BATCH_SIZE, capture="changes",
+               rebuild_latest=False, snapshot=True, checkpoint=None):
+    # The connection belongs to the writer thread, so neither the schema setup
+    # (which may ALTER the large price history), the history rebuild nor the
+    # price writes hold up page loads in the event loop
+    connection = await asyncio.to_thread(connect)
+    writer = BackgroundWriter(connection)
+    latest_filled, categories = await writer.run(prepare_tables)
 
-        for cat in categories:
-            print(f"\nScraping category {cat['id']}: {cat['parent_category']} > {cat['sub_category']}")
-            products = await scrape_products_from_url(page, cat['url'])
-            print(f"Extracted {len(products)} products from category {cat['sub_category']}")
+    # First run with the table (or asked for): seed it from the existing history
+    if rebuild_latest or not latest_filled:
+        await writer.run(rebuild_latest_prices)
 
-            with connection.cursor() as cursor:
-                for i, product in enumerate(products, start=1):
-                    # Check if product exists by url (preferred unique key)
-                    cursor.execute("SELECT id FROM products WHERE url = %s", (product['url'],))
-                    result = cursor.fetchone()
-
-                    if result:
-                        product_id = result['id']
-                        # Optionally update price in products table if needed here
-                        # cursor.execute("UPDATE products SET price = %s WHERE id = %s", (product['price'], product_id))
-                    else:
-                        # Insert new product
-                        cursor.execute('''
-                            INSERT INTO products (name, price, url, image_url)
-                            VALUES (%s, %s, %s, %s)
-                        ''', (product['name'], product['price'], product['url'], product['image_url']))
-                        product_id = cursor.lastrowid
+    url_index = await writer.run(load_url_index)
+    print(f"Loaded {len(url_index)} known product URLs")
+    last_prices = await writer.run(load_last_prices)
+    print(f"Loaded last known prices of {len(last_prices)} products")
 
-                    # Insert into product_prices table
-                    cursor.execute('''
-                        INSERT INTO product_prices (product_id, price)
-                        VALUES (%s, %s)
-                    ''', (product_id, product['price']))
+    categories = remaining_categories(categories, checkpoint)
 
-                    if i % 10 == 0 or i == len(products):
-                        print(f"Inserted {i}/{len(products)} products with price history")
+    # Runs on the writer thread, which is also the only one using url_index and last_prices
+    store = partial(store_prices, url_index=url_index, last_prices=last_prices,
+                    batch_size=batch_size, changes_only=capture == "changes")
+    on_category = store_on_writer(writer, store, checkpoint)
 
-                connection.commit()
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(headless=True)
+        category_metrics, failed = await crawl_categories(
+            browser, categories,
+            on_category,
+            concurrency, retries, block, max_wait,
+        )
 
         await browser.close()
 
+    print_scroll_summary(category_metrics)
+
+    await writer.close()
     connection.close()
+    check_failed_categories(failed, checkpoint)
     print("\n✅ All categories scraped and price histories updated.")
 
+    # Publish the new prices to the dashboards
+    if snapshot:
+        await asyncio.to_thread(write_snapshot)
+
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    args = parse_args()
+    asyncio.run(main(**vars(args)))
+    print(QUERY_STATS.summary())